@@ -8,6 +8,14 @@ load_dotenv()
 
 st.set_page_config(page_title="Enterprise Survey Dashboard", layout="wide")
 
+
+# Streamlit reruns this script on every interaction; cache_resource keeps
+# one pooled engine per URL for the life of the server instead.
+@st.cache_resource
+def get_engine(url):
+    return create_engine(url, pool_pre_ping=True, pool_size=int(os.getenv("DB_POOL_SIZE", "5")))
+
+
 class BuildDashboard:
     def __init__(self):
         # --- DB connection details from docker-compose ---
@@ -16,7 +24,7 @@ class BuildDashboard:
         self.DB_PASSWORD = os.environ["DB_PASSWORD"]
         self.DB_NAME = os.environ["DB_NAME"]
 
-        self.engine = create_engine(f"postgresql+psycopg2://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}/{self.DB_NAME}")
+        self.engine = get_engine(f"postgresql+psycopg2://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}/{self.DB_NAME}")
         
     def load_data(self, query) -> pd.DataFrame:
         with self.engine.connect() as conn:
@@ -8,6 +8,16 @@ load_dotenv()
 
 logging.basicConfig(level=logging.INFO, )
 
+# Engines are shared per process, keyed by URL
+_ENGINES = {}
+
+
+def get_engine(url):
+    if url not in _ENGINES:
+        _ENGINES[url] = create_engine(url, pool_pre_ping=True,
+                                      pool_size=int(os.getenv("DB_POOL_SIZE", "5")))
+    return _ENGINES[url]
+
 class Extractor:
     
     def __init__(self):
@@ -37,7 +47,7 @@ class Extractor:
 
     def _connect_db(self):
         logging.info("Establishing database connection...")
-        self.engine = create_engine(f"postgresql+psycopg2://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}/{self.DB_NAME}")
+        self.engine = get_engine(f"postgresql+psycopg2://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}/{self.DB_NAME}")
             
 
     def load(self,):
@@ -0,0 +1,117 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Local SQLite file holding the last response per city; set to '' to disable
+CACHE_PATH = os.getenv("WEATHER_CACHE_PATH", str(Path(__file__).resolve().parent / "cache" / "responses.db"))
+
+# OpenWeather refreshes an observation about every 10 minutes, so a payload
+# is current until its 'dt' is this old
+OBSERVATION_TTL = int(os.getenv("CACHE_OBSERVATION_TTL", "600"))
+
+# Stations can report late; never ask again for a city sooner than this
+MIN_REFETCH_SECONDS = int(os.getenv("CACHE_MIN_REFETCH_SECONDS", "300"))
+
+
+class ResponseCache:
+    """
+    Persistent cache of API responses keyed by city ('id:2320576') or by
+    name query ('q:Umuahia,NG'). A cached payload is served without a call
+    while its observation is current; after that its ETag/Last-Modified,
+    when the API sent them, turn the next call into a conditional request.
+    Safe to share between the fetch threads.
+    """
+    def __init__(self, path=CACHE_PATH):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            payload TEXT NOT NULL,
+            observed_at INTEGER,
+            fetched_at REAL NOT NULL,
+            etag TEXT,
+            last_modified TEXT
+        );
+        """)
+
+    @classmethod
+    def from_env(cls):
+        """
+        The cache at WEATHER_CACHE_PATH, or None when it is disabled or
+        cannot be opened; extraction then simply calls the API every time.
+        """
+        if not CACHE_PATH:
+            return None
+        try:
+            return cls(CACHE_PATH)
+        except (OSError, sqlite3.Error) as e:
+            logging.info(f"Response cache unavailable at {CACHE_PATH}, calling the API for every city. Error: {e}")
+            return None
+
+    def get(self, key):
+        """
+        The cached entry for key as a dict, or None.
+        """
+        with self.lock:
+            row = self.conn.execute("""
+            SELECT payload, observed_at, fetched_at, etag, last_modified FROM responses WHERE key = ?;
+            """, (key,)).fetchone()
+
+        if row is None:
+            return None
+
+        payload, observed_at, fetched_at, etag, last_modified = row
+        return {'payload': json.loads(payload), 'observed_at': observed_at, 'fetched_at': fetched_at,
+                'etag': etag, 'last_modified': last_modified}
+
+    @staticmethod
+    def is_fresh(entry, now=None):
+        now = now or time.time()
+        expires_at = max((entry['observed_at'] or 0) + OBSERVATION_TTL, entry['fetched_at'] + MIN_REFETCH_SECONDS)
+        return now < expires_at
+
+    def fresh(self, key):
+        """
+        The cached payload for key if it is still current, else None.
+        """
+        entry = self.get(key)
+        return entry['payload'] if entry and self.is_fresh(entry) else None
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def put(self, keys, payload, headers=None):
+        """
+        Store a freshly fetched payload under each of keys.
+        """
+        headers = headers or {}
+        row = (json.dumps(payload), payload.get('dt'), time.time(), headers.get('ETag'), headers.get('Last-Modified'))
+
+        with self.lock:
+            self.conn.executemany("""
+            INSERT INTO responses (key, payload, observed_at, fetched_at, etag, last_modified)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                payload = excluded.payload, observed_at = excluded.observed_at, fetched_at = excluded.fetched_at,
+                etag = excluded.etag, last_modified = excluded.last_modified;
+            """, [(key, *row) for key in keys])
+
+    def touch(self, key):
+        """
+        Record a 304 Not Modified: the cached payload is confirmed as of now.
+        """
+        with self.lock:
+            self.conn.execute("UPDATE responses SET fetched_at = ? WHERE key = ?;", (time.time(), key))
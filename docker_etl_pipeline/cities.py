@@ -0,0 +1,101 @@
+import logging
+from pathlib import Path
+from sqlalchemy import text
+
+# City lists other than the capitals live here, one per group: cities/<group>.txt
+CITY_LIST_DIR = Path(__file__).resolve().parent / "cities"
+
+CAPITAL_CITIES = [
+    "Umuahia", "Yola", "Uyo", "Awka", "Bauchi", "Yenagoa", "Makurdi",
+    "Maiduguri", "Calabar", "Asaba", "Abakaliki", "Benin", "Ado-Ekiti",
+    "Enugu", "Gombe", "Owerri", "Dutse", "Kaduna", "Kano", "Katsina",
+    "Birnin Kebbi", "Lokoja", "Ilorin", "Ikeja", "Lafia", "Minna",
+    "Abeokuta", "Akure", "Oshogbo", "Ibadan", "Jos", "Port Harcourt",
+    "Sokoto", "Jalingo", "Damaturu", "Gusau", "Abuja"
+]
+
+
+def city_queries(group="capitals"):
+    """
+    The API queries ("Name,CC") for a city group.
+    'capitals' is built in; any other group is read from cities/<group>.txt,
+    one city per line, with '#' comments. Lines without a country code get ",NG".
+    """
+    if group == "capitals":
+        names = CAPITAL_CITIES
+    else:
+        path = CITY_LIST_DIR / f"{group}.txt"
+        names = [line.split("#", 1)[0].strip() for line in path.read_text(encoding="utf-8").splitlines()]
+        names = [name for name in names if name]
+
+    queries = [name if "," in name else f"{name},NG" for name in names]
+    # Keep the first occurrence of any city listed twice
+    return list(dict.fromkeys(queries))
+
+
+class CityRegistry:
+    """
+    Persists the OpenWeather city ID behind each query in city_lookups, so
+    a city is geocoded by name once and fetched by ID on every later run.
+    The city itself is stored in the cities table.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+
+    def lookup(self, queries) -> dict:
+        """
+        {query: city_id} for the queries resolved on an earlier run.
+        """
+        with self.engine.connect() as conn:
+            rows = conn.execute(text("""
+            SELECT query, city_id FROM city_lookups WHERE query = ANY(:queries);
+            """), {'queries': list(queries)}).fetchall()
+        return dict(rows)
+
+    def remember(self, resolved, group):
+        """
+        Store {query: city weather payload} from name lookups.
+        """
+        if not resolved:
+            return
+
+        cities = {data['id']: (data['name'], data['sys']['country']) for data in resolved.values()}
+
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+            INSERT INTO cities (city_id, city_name, country_code)
+            SELECT * FROM unnest(CAST(:ids AS INTEGER[]), CAST(:names AS TEXT[]), CAST(:countries AS TEXT[]))
+            ON CONFLICT (city_id) DO NOTHING;
+            """), {
+                'ids': list(cities),
+                'names': [name for name, _ in cities.values()],
+                'countries': [country for _, country in cities.values()],
+            })
+            conn.execute(text("""
+            INSERT INTO city_lookups (query, city_id, city_group)
+            SELECT * FROM unnest(CAST(:queries AS TEXT[]), CAST(:ids AS INTEGER[]), CAST(:groups AS TEXT[]))
+            ON CONFLICT (query) DO UPDATE SET city_id = EXCLUDED.city_id, resolved_at = NOW();
+            """), {
+                'queries': list(resolved),
+                'ids': [data['id'] for data in resolved.values()],
+                'groups': [group] * len(resolved),
+            })
+
+        logging.info(f"Stored city IDs for {len(resolved)} newly resolved cities.")
+
+    def current(self, city_ids, max_age_seconds) -> set:
+        """
+        The cities whose latest stored observation is under max_age_seconds
+        old, i.e. those the API has no newer reading for yet.
+        """
+        if not city_ids:
+            return set()
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(text("""
+            SELECT city_id FROM weather_readings
+            WHERE city_id = ANY(:ids)
+            GROUP BY city_id
+            HAVING MAX(observation_timestamp_utc) > NOW() - make_interval(secs => :max_age);
+            """), {'ids': list(city_ids), 'max_age': max_age_seconds}).fetchall()
+        return {city_id for city_id, in rows}
@@ -0,0 +1,141 @@
+import os
+import logging
+import threading
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Pool sizing per process
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Each entry upgrades the schema by one version. Version 1 is the DDL that
+# LoadWeatherData used to run before every load; it keeps IF NOT EXISTS because
+# a weather database from before schema_version already has both tables.
+MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS cities (
+        city_id INTEGER PRIMARY KEY,
+        city_name VARCHAR(100) NOT NULL,
+        country_code VARCHAR(2) NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS weather_readings (
+        id SERIAL PRIMARY KEY,
+        city_id INTEGER REFERENCES cities(city_id),
+        observation_timestamp_utc TIMESTAMP WITH TIME ZONE,
+        temperature_celsius NUMERIC(5, 2),
+        feels_like_celsius NUMERIC(5, 2),
+        min_temperature_celsius NUMERIC(5, 2),
+        max_temperature_celsius NUMERIC(5, 2),
+        humidity_percent INTEGER,
+        pressure_hpa INTEGER,
+        visibility_meters INTEGER,
+        wind_speed_ms NUMERIC(5, 2),
+        wind_direction_deg INTEGER,
+        weather_condition VARCHAR(50),
+        weather_description VARCHAR(100),
+        sunrise_utc TIMESTAMP WITH TIME ZONE,
+        sunset_utc TIMESTAMP WITH TIME ZONE,
+        daylight_duration_hours NUMERIC(4, 2),
+        UNIQUE (city_id, observation_timestamp_utc)
+    );
+    """,
+    # 2: the OpenWeather city ID each query ("Umuahia,NG") resolved to
+    """
+    CREATE TABLE city_lookups (
+        query VARCHAR(120) PRIMARY KEY,
+        city_id INTEGER NOT NULL REFERENCES cities(city_id),
+        city_group VARCHAR(50) NOT NULL,
+        resolved_at TIMESTAMPTZ DEFAULT NOW()
+    );
+    CREATE INDEX city_lookups_group_idx ON city_lookups (city_group);
+    """,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+_engine = None
+_schema_ready = False
+_lock = threading.Lock()
+
+
+def database_url():
+    user = os.getenv("POSTGRES_USER")
+    password = os.getenv("POSTGRES_PASSWORD")
+    host = os.getenv("POSTGRES_DB_CONTAINER_NAME")
+    port = os.getenv("POSTGRES_PORT", "5432")
+    dbname = os.getenv("POSTGRES_DB")
+
+    #check db connection cred
+    if not all([user, password, host, port, dbname]):
+        raise ValueError("One or more database environment variables are not set.")
+
+    return f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{dbname}"
+
+
+def get_engine():
+    """
+    Return the process-wide pooled engine, creating it on first use.
+    pool_pre_ping replaces connections the server dropped in between runs.
+    """
+    global _engine
+
+    with _lock:
+        if _engine is None:
+            _engine = create_engine(
+                database_url(),
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_recycle=DB_POOL_RECYCLE,
+                pool_pre_ping=True,
+            )
+        return _engine
+
+
+def _current_version(conn):
+    if conn.execute(text("SELECT to_regclass('schema_version');")).scalar() is None:
+        return 0
+    return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version;")).scalar()
+
+
+def ensure_schema(engine=None):
+    """
+    Bring the schema up to SCHEMA_VERSION, at most once per process.
+    An up-to-date database costs a single version check.
+    """
+    global _schema_ready
+
+    if _schema_ready:
+        return
+
+    engine = engine or get_engine()
+
+    with _lock:
+        if _schema_ready:
+            return
+
+        with engine.connect() as conn:
+            version = _current_version(conn)
+
+        if version < SCHEMA_VERSION:
+            with engine.begin() as conn:
+                conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('weather_schema'));"))
+                conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    applied_at TIMESTAMPTZ DEFAULT NOW()
+                );
+                """))
+
+                version = _current_version(conn)
+                for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                    logging.info(f"Applying schema migration {number}")
+                    conn.execute(text(migration))
+                    conn.execute(text("INSERT INTO schema_version (version) VALUES (:version);"),
+                                 {'version': number})
+
+        logging.info("Schema is ready.")
+        _schema_ready = True
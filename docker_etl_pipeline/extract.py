@@ -1,60 +1,307 @@
 import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dotenv import load_dotenv
-import os
 import requests
+from requests.adapters import HTTPAdapter
 import logging
 
+from cache import OBSERVATION_TTL, ResponseCache
+from cities import CityRegistry, city_queries
+from db import ensure_schema, get_engine
+
 
 load_dotenv()
 
+# Root of the OpenWeather API; point it at a local mock server for testing
+API_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5").rstrip("/")
+
+# Which city list to fetch: 'capitals' or the name of a cities/<group>.txt file
+CITY_GROUP = os.getenv("CITY_GROUP", "capitals")
+
+# Fetch known city IDs with /group, which takes up to 20 IDs per call
+USE_GROUP_ENDPOINT = os.getenv("API_USE_GROUP", "1") not in ("0", "false", "False")
+GROUP_SIZE = 20
+
+# Concurrency and quota. The free plan allows 60 calls per minute.
+MAX_WORKERS = int(os.getenv("EXTRACT_MAX_WORKERS", "32"))
+CALLS_PER_MINUTE = int(os.getenv("API_CALLS_PER_MINUTE", "60"))
+
+# (connect, read) timeouts in seconds
+REQUEST_TIMEOUT = (float(os.getenv("API_CONNECT_TIMEOUT", "5")), float(os.getenv("API_READ_TIMEOUT", "15")))
+
+# Retries for connection errors, 429 and 5xx, with exponential backoff (0.5s, 1s, 2s, ...)
+MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "3"))
+RETRY_BACKOFF = float(os.getenv("API_RETRY_BACKOFF", "0.5"))
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+class RateLimiter:
+    """
+    Token bucket shared by the fetch threads: up to `calls_per_minute`
+    calls can go out at once, after which calls are spaced to stay within
+    the quota.
+    """
+    def __init__(self, calls_per_minute):
+        self.capacity = max(1, calls_per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+def build_session(pool_size=MAX_WORKERS):
+    """
+    A keep-alive session whose connection pool fits every fetch thread.
+    It does not retry: ExtractWeatherData._get does, so that every attempt
+    goes through the rate limiter.
+    """
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
 
 class ExtractWeatherData:
     """
-    A class to extract weather data for Nigerian capital cities
+    A class to extract current weather data for a group of Nigerian cities
     from the OpenWeatherMap API.
+    Cities are geocoded by name only the first time; their IDs are stored
+    through the CityRegistry and later runs fetch them by ID, 20 per call.
+    Cities whose stored or cached observation is still current are not
+    fetched again. Pass cache=False to always call the API.
     """
-    def __init__(self,):
+    def __init__(self, group=CITY_GROUP, session=None, max_workers=MAX_WORKERS, rate_limiter=None,
+                 registry=None, use_group_endpoint=USE_GROUP_ENDPOINT, cache=None):
         self.api_key = os.environ["API_KEY"]
-        self.base_url = "https://api.openweathermap.org/data/2.5/weather"
-
-    def _get_capital_cities(self) -> list:
-        return [
-            "Umuahia", "Yola", "Uyo", "Awka", "Bauchi", "Yenagoa", "Makurdi",
-            "Maiduguri", "Calabar", "Asaba", "Abakaliki", "Benin", "Ado-Ekiti",
-            "Enugu", "Gombe", "Owerri", "Dutse", "Kaduna", "Kano", "Katsina",
-            "Birnin Kebbi", "Lokoja", "Ilorin", "Ikeja", "Lafia", "Minna",
-            "Abeokuta", "Akure", "Oshogbo", "Ibadan", "Jos", "Port Harcourt",
-            "Sokoto", "Jalingo", "Damaturu", "Gusau", "Abuja"
-        ]
+        self.base_url = API_BASE_URL
+        self.group = group
+        self.max_workers = max_workers
+        self.session = session or build_session(max_workers)
+        self.rate_limiter = rate_limiter or RateLimiter(CALLS_PER_MINUTE)
+        self.registry = registry
+        self.use_group_endpoint = use_group_endpoint
+        self.cache = ResponseCache.from_env() if cache is None else (cache or None)
+        self.api_calls = 0
 
-    def extract(self) -> list:
-        capital_names = self._get_capital_cities()
-        logging.info(f"Fetching 5-day weather forecast for {len(capital_names)} Nigerian capital cities...")
+    def _get_registry(self):
+        """
+        The registry for stored city IDs. Without a reachable database the
+        run still works, it just resolves every city by name.
+        """
+        if self.registry is None:
+            try:
+                engine = get_engine()
+                ensure_schema(engine)
+                self.registry = CityRegistry(engine)
+            except Exception as e:
+                logging.info(f"City ID registry unavailable, fetching cities by name. Error: {e}")
+                self.registry = False
+        return self.registry or None
 
-        weather_data = []
-        for name in capital_names:
-            city_query = f"{name},NG"
+    @staticmethod
+    def _retry_delay(attempt, response=None):
+        """
+        Seconds to wait before retrying: the server's Retry-After when it
+        gives one in seconds, else exponential backoff.
+        """
+        retry_after = response.headers.get("Retry-After", "") if response is not None else ""
+        if retry_after.isdigit():
+            return float(retry_after)
+        return RETRY_BACKOFF * 2 ** attempt
 
-            params = {
-                'q': city_query,
-                'appid': self.api_key,
-                'units': 'metric'  #temperature in Celsius
-            }
+    def _get(self, endpoint, params, cache_key=None):
+        """
+        One rate-limited API call, retried up to MAX_RETRIES times on
+        connection errors, 429 and 5xx. Every attempt takes its own rate
+        limiter token, so retries count against the quota like any call.
+        Raises requests exceptions once the retries are used up.
+        With a cache_key the call is conditional on the cached response's
+        validators, and the result is cached under the key and its city ID.
+        """
+        entry = self.cache.get(cache_key) if self.cache and cache_key else None
+
+        for attempt in range(MAX_RETRIES + 1):
+            self.rate_limiter.acquire()
+            self.api_calls += 1
 
             try:
-                response = requests.get(self.base_url, params=params)
-                response.raise_for_status()
-                
-                # The entire JSON forecast data for the city is appended.
-                weather_data.append(response.json())
-                logging.info(f"Successfully fetched data for: {name}")
-
-            except requests.exceptions.RequestException as e:
-                logging.info(f"Could not fetch weather data for {name}. Error: {e}")
-
-        if weather_data:
-            logging.info(f"\nSuccessfully extracted data for {len(weather_data)} cities.")
+                response = self.session.get(f"{self.base_url}/{endpoint}",
+                                            params={**params, 'appid': self.api_key, 'units': 'metric'},
+                                            headers=ResponseCache.conditional_headers(entry),
+                                            timeout=REQUEST_TIMEOUT)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt == MAX_RETRIES:
+                    raise
+                time.sleep(self._retry_delay(attempt))
+                continue
+
+            if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                break
+            time.sleep(self._retry_delay(attempt, response))
+
+        if response.status_code == 304 and entry:
+            self.cache.touch(cache_key)
+            return entry['payload']
+
+        response.raise_for_status()
+        data = response.json()
+
+        if self.cache and cache_key:
+            self.cache.put(dict.fromkeys([cache_key, f"id:{data.get('id')}"]), data, response.headers)
+        return data
+
+    def _fetch_by_name(self, query):
+        try:
+            data = self._get("weather", {'q': query}, cache_key=f"q:{query}")
+            logging.info(f"Successfully fetched data for: {query}")
+            return data
+
+        except requests.exceptions.RequestException as e:
+            logging.info(f"Could not fetch weather data for {query}. Error: {e}")
+            return None
+
+    def _fetch_by_id(self, city_id):
+        try:
+            return [self._get("weather", {'id': city_id}, cache_key=f"id:{city_id}")]
+
+        except requests.exceptions.RequestException as e:
+            logging.info(f"Could not fetch weather data for city {city_id}. Error: {e}")
+            return []
+
+    def _fetch_group(self, city_ids):
+        """
+        Fetch up to GROUP_SIZE cities in one call. Returns None if the API
+        plan does not offer /group; the caller then fetches the IDs one by
+        one, and so does every later group of the run.
+        """
+        if not self.use_group_endpoint:
+            return None
+
+        try:
+            weather_data = self._get("group", {'id': ",".join(str(city_id) for city_id in city_ids)})['list']
+            if self.cache:
+                for data in weather_data:
+                    self.cache.put([f"id:{data['id']}"], data)
+            return weather_data
+
+        except requests.exceptions.HTTPError as e:
+            if e.response is None or e.response.status_code not in (400, 401, 403, 404):
+                logging.info(f"Could not fetch weather data for cities {city_ids}. Error: {e}")
+                return []
+            logging.info(f"/group is not available ({e}), fetching cities one by one.")
+            self.use_group_endpoint = False
+            return None
+
+        except requests.exceptions.RequestException as e:
+            logging.info(f"Could not fetch weather data for cities {city_ids}. Error: {e}")
+            return []
+
+    def stream(self):
+        """
+        Yield each city's payload as soon as its call returns, so the next
+        stage starts on the first cities while later ones are still in flight.
+        Cities resolved by name are stored once the stream is exhausted.
+        """
+        queries = city_queries(self.group)
+        registry = self._get_registry()
+
+        known = registry.lookup(queries) if registry else {}
+        unresolved = [query for query in queries if query not in known]
+        city_ids = list(dict.fromkeys(known[query] for query in queries if query in known))
+
+        # Already stored and no newer observation yet: nothing to fetch or load
+        current = registry.current(city_ids, OBSERVATION_TTL) if registry else set()
+        city_ids = [city_id for city_id in city_ids if city_id not in current]
+
+        resolved = {}
+        cached = []
+        if self.cache:
+            for city_id in list(city_ids):
+                data = self.cache.fresh(f"id:{city_id}")
+                if data:
+                    cached.append(data)
+                    city_ids.remove(city_id)
+            for query in list(unresolved):
+                data = self.cache.fresh(f"q:{query}")
+                if data:
+                    resolved[query] = data
+                    cached.append(data)
+                    unresolved.remove(query)
+
+        if self.use_group_endpoint:
+            groups = [city_ids[i:i + GROUP_SIZE] for i in range(0, len(city_ids), GROUP_SIZE)]
+        else:
+            groups = []
+
+        logging.info(f"Fetching current weather for {len(queries)} cities in group '{self.group}': "
+                     f"{len(city_ids)} by ID, {len(unresolved)} by name, {len(cached)} from cache, "
+                     f"{len(current)} skipped as already current...")
+
+        seen = set()
+        for data in cached:
+            if data['id'] not in seen:
+                seen.add(data['id'])
+                yield data
+
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            # future -> ('name', query) | ('group', city_ids) | ('id', city_id)
+            futures = {pool.submit(self._fetch_by_name, query): ('name', query) for query in unresolved}
+            futures.update({pool.submit(self._fetch_group, group): ('group', group) for group in groups})
+            if not groups:
+                futures.update({pool.submit(self._fetch_by_id, city_id): ('id', city_id) for city_id in city_ids})
+
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, key = futures.pop(future)
+                    result = future.result()
+
+                    if kind == 'name':
+                        if not result:
+                            continue
+                        resolved[key] = result
+                        result = [result]
+                    elif kind == 'group' and result is None:
+                        # /group refused: one concurrent call per ID instead
+                        futures.update({pool.submit(self._fetch_by_id, city_id): ('id', city_id)
+                                        for city_id in key})
+                        continue
+
+                    # A city reached through two queries is yielded once
+                    for data in result:
+                        if data['id'] not in seen:
+                            seen.add(data['id'])
+                            yield data
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+        if registry and resolved:
+            registry.remember(resolved, self.group)
+
+        if seen or current:
+            logging.info(f"\nSuccessfully extracted data for {len(seen)} cities "
+                         f"with {self.api_calls} API calls.")
         else:
             logging.info("\nExtraction finished, but no data was fetched. Please check the errors above.")
 
-        return weather_data
+    def extract(self) -> list:
+        return list(self.stream())
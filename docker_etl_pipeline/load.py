@@ -1,138 +1,161 @@
+import io
 import os
+import time
 import pandas as pd
-from sqlalchemy import create_engine, text
 from dotenv import load_dotenv
-from transform import TransformWeatherData
+from sqlalchemy import text
+from db import ensure_schema, get_engine
 import logging
 
 logging.basicConfig(level=logging.INFO)
 
 load_dotenv()
 
-class LoadWeatherData:
-    def __init__(self):
-        self.user = os.getenv("POSTGRES_USER")
-        self.password = os.getenv("POSTGRES_PASSWORD")
-        self.host = os.getenv("POSTGRES_DB_CONTAINER_NAME")
-        self.port = 5432
-        self.dbname = os.getenv("POSTGRES_DB")
-
-        #check db connection cred
-        if not all([self.user, self.password, self.host, self.port, self.dbname]):
-            raise ValueError("One or more database environment variables are not set.")
+# A micro-batch is written when it is full or has waited this long for more rows
+LOAD_BATCH_SIZE = int(os.getenv("LOAD_BATCH_SIZE", "50"))
+LOAD_FLUSH_SECONDS = float(os.getenv("LOAD_FLUSH_SECONDS", "5"))
+
+CITY_COLUMNS = ['city_id', 'city_name', 'country_code']
+
+READING_COLUMNS = [
+    'city_id', 'temperature_celsius', 'feels_like_celsius', 'min_temperature_celsius',
+    'max_temperature_celsius', 'humidity_percent', 'pressure_hpa', 'visibility_meters',
+    'wind_speed_ms', 'wind_direction_deg', 'weather_condition', 'weather_description',
+    'observation_timestamp_utc', 'sunrise_utc', 'sunset_utc', 'daylight_duration_hours',
+]
+
+# Two queries in a group can resolve to the same city, so a batch may stage a
+# city_id twice; ON CONFLICT DO UPDATE would fail on the second, hence DISTINCT ON.
+# A city whose name and country are unchanged is not rewritten.
+CITY_UPSERT = """
+INSERT INTO cities (city_id, city_name, country_code)
+SELECT DISTINCT ON (city_id) city_id, city_name, country_code
+FROM cities_stage
+ORDER BY city_id
+ON CONFLICT (city_id) DO UPDATE SET
+    city_name = EXCLUDED.city_name,
+    country_code = EXCLUDED.country_code
+WHERE (cities.city_name, cities.country_code)
+    IS DISTINCT FROM (EXCLUDED.city_name, EXCLUDED.country_code);
+"""
+
+_READING_VALUES = [column for column in READING_COLUMNS
+                   if column not in ('city_id', 'observation_timestamp_utc')]
+
+READING_UPSERT = f"""
+INSERT INTO weather_readings ({", ".join(READING_COLUMNS)})
+SELECT DISTINCT ON (city_id, observation_timestamp_utc) {", ".join(READING_COLUMNS)}
+FROM weather_readings_stage
+ORDER BY city_id, observation_timestamp_utc
+ON CONFLICT (city_id, observation_timestamp_utc) DO UPDATE SET
+    {", ".join(f"{column} = EXCLUDED.{column}" for column in _READING_VALUES)}
+WHERE ({", ".join(f"weather_readings.{column}" for column in _READING_VALUES)})
+    IS DISTINCT FROM ({", ".join(f"EXCLUDED.{column}" for column in _READING_VALUES)});
+"""
+
+
+def micro_batches(records, batch_size=LOAD_BATCH_SIZE, flush_seconds=LOAD_FLUSH_SECONDS):
+    """
+    Group a stream of records into lists of at most batch_size. A batch is
+    also cut once it is flush_seconds old, checked as each record arrives,
+    so a slow stream still lands rows early.
+    """
+    batch = []
+    started = None
+
+    for record in records:
+        if not batch:
+            started = time.monotonic()
+        batch.append(record)
+
+        if len(batch) >= batch_size or time.monotonic() - started >= flush_seconds:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
 
-        #transformed data
-        self.transformed_data = TransformWeatherData().run_transform()
 
-        # # Create a SQLAlchemy engine
-        self.engine = create_engine(f"postgresql+psycopg2://{self.user}:{self.password}@{self.host}:{self.port}/{self.dbname}")
+class LoadWeatherData:
+    def __init__(self, engine=None):
+        # shared pooled engine; raises early if the db env variables are missing
+        self.engine = engine or get_engine()
 
     def _setup_schema(self):
-        create_cities_table = """
-        CREATE TABLE IF NOT EXISTS cities (
-            city_id INTEGER PRIMARY KEY,
-            city_name VARCHAR(100) NOT NULL,
-            country_code VARCHAR(2) NOT NULL
-        );
-        """
-        create_readings_table = """
-        CREATE TABLE IF NOT EXISTS weather_readings (
-            id SERIAL PRIMARY KEY,
-            city_id INTEGER REFERENCES cities(city_id),
-            observation_timestamp_utc TIMESTAMP WITH TIME ZONE,
-            temperature_celsius NUMERIC(5, 2),
-            feels_like_celsius NUMERIC(5, 2),
-            min_temperature_celsius NUMERIC(5, 2),
-            max_temperature_celsius NUMERIC(5, 2),
-            humidity_percent INTEGER,
-            pressure_hpa INTEGER,
-            visibility_meters INTEGER,
-            wind_speed_ms NUMERIC(5, 2),
-            wind_direction_deg INTEGER,
-            weather_condition VARCHAR(50),
-            weather_description VARCHAR(100),
-            sunrise_utc TIMESTAMP WITH TIME ZONE,
-            sunset_utc TIMESTAMP WITH TIME ZONE,
-            daylight_duration_hours NUMERIC(4, 2),
-            UNIQUE (city_id, observation_timestamp_utc)
-        );
-        """
         try:
-            with self.engine.connect() as conn:
-                conn.execute(text(create_cities_table))
-                conn.execute(text(create_readings_table))
-                conn.commit()
-            print("Schema is ready.")
+            ensure_schema(self.engine)
         except Exception as e:
             print(f"An error occurred during schema setup: {e}")
             raise
 
+    def load_stream(self, frames):
+        """
+        Load a stream of transformed micro-batches (DataFrames), so memory
+        stays at one batch however long the city list is. Returns the rows
+        handed to the database.
+        """
+        #setup db schema
+        self._setup_schema()
 
+        loaded = 0
+        for weather_df in frames:
+            if len(weather_df):
+                self.load_data(weather_df)
+                loaded += len(weather_df)
 
-    def load_data(self,):
+        if not loaded:
+            logging.info("No data to load. Aborting.")
+        return loaded
+
+    def load_data(self, weather_df):
 
         #setup db schema
         self._setup_schema()
 
 
-        if not self.transformed_data:
+        if weather_df is None or len(weather_df) == 0:
             logging.info("No data to load. Aborting.")
-            return
+            return 0
 
-        weather_df = pd.DataFrame(self.transformed_data)
+        weather_df = pd.DataFrame(weather_df)
 
-        #data for city table
-        cities_df = weather_df[['city_id', 'city_name', 'country_code']].drop_duplicates().reset_index(drop=True)
-
-        #data for the weather table
-        weather_columns = [
-            'city_id', 'temperature_celsius', 'feels_like_celsius', 'min_temperature_celsius',
-            'max_temperature_celsius', 'humidity_percent', 'pressure_hpa', 'visibility_meters',
-            'wind_speed_ms', 'wind_direction_deg', 'weather_condition', 'weather_description',
-            'observation_timestamp_utc', 'sunrise_utc', 'sunset_utc',
-        ]
-        readings_df = weather_df[weather_columns]
+        logging.info(f"Loading {len(weather_df)} weather readings into 'weather_readings' table...")
 
         try:
+            # cities and readings commit together or not at all, so a retry starts clean
+            with self.engine.begin() as conn:
+                cities_added = self._copy_upsert(conn, "cities", weather_df[CITY_COLUMNS], CITY_UPSERT)
+                readings_added = self._copy_upsert(conn, "weather_readings", weather_df[READING_COLUMNS],
+                                                   READING_UPSERT)
 
+            logging.info(f"Load complete. {cities_added} cities and {readings_added} weather readings "
+                         f"added or updated.")
+            return readings_added
 
-            with self.engine.connect() as conn:
-
-                #load cities data into cities table
-                cities_df.to_sql(
-                name='cities',
-                con=conn,
-                if_exists='append',
-                index=False,
-                method=self.upsert_cities # Custom method to handle primary key conflicts
-            )
-                
-            # load readings data
-            logging.info(f"Loading {len(weather_df)} weather readings into 'weather_readings' table...")
-            readings_df.to_sql(
-                'weather_readings',
-                self.engine,
-                if_exists='append',
-                index=False
-            )
-        
         except Exception as e:
-            logging.info(f"Could not load data, {e}")
-            
+            logging.error(f"Could not load data, {e}")
+            raise
+
     @staticmethod
-    def upsert_cities(table, conn, keys, data_iter):
+    def _copy_upsert(conn, table, df, upsert):
         """
-        Custom method for pd.to_sql to handle ON CONFLICT DO NOTHING for the cities table.
-        This prevents errors if a city already exists.
+        COPY the frame into a temp staging table shaped like `table`, then
+        merge it with one set-based INSERT ... ON CONFLICT. Returns the rows
+        inserted or changed.
         """
-        from sqlalchemy.dialects.postgresql import insert
-
-        data = [dict(zip(keys, row)) for row in data_iter]
-
-        stmt = insert(table.table).values(data)
-        stmt = stmt.on_conflict_do_nothing(
-            index_elements=['city_id']
-        )
-        conn.execute(stmt)
-
-LoadWeatherData().load_data()
\ No newline at end of file
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+
+        stage = f"{table}_stage"
+        conn.execute(text(f"""
+        CREATE TEMP TABLE {stage} ON COMMIT DROP AS
+        SELECT {", ".join(df.columns)} FROM {table} WITH NO DATA;
+        """))
+
+        # copy_expert uses the psycopg2 connection under conn, so the staged rows
+        # commit or roll back together with the cities and readings upserts
+        with conn.connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY {stage} ({', '.join(df.columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+        return conn.execute(text(upsert)).rowcount
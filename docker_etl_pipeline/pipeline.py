@@ -0,0 +1,27 @@
+from dotenv import load_dotenv
+from extract import ExtractWeatherData
+from transform import TransformWeatherData
+from load import LoadWeatherData, micro_batches
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+load_dotenv()
+
+
+def run_pipeline(group=None, extractor=None, loader=None):
+    """
+    Extract, transform and load as one stream: payloads are grouped into
+    micro-batches as they arrive, each batch is transformed at once and
+    loaded, so the first rows land while later cities are still being fetched.
+    A long-running caller passes its own extractor and loader to reuse their
+    HTTP session and database engine between runs.
+    """
+    loader = loader or LoadWeatherData()
+    extractor = extractor or (ExtractWeatherData(group=group) if group else ExtractWeatherData())
+
+    frames = TransformWeatherData().transform_batches(micro_batches(extractor.stream()))
+    return loader.load_stream(frames)
+
+if __name__ == "__main__":
+    run_pipeline()
@@ -1,23 +1,38 @@
 #!/bin/bash
 set -e
 
+# Usage: ./run_etl.sh          run the ETL once in a fresh environment
+#        ./run_etl.sh service  keep Postgres and start the resident poller (service.py)
+MODE="${1:-once}"
+
 # Load environment variables from .env file
 export $(grep -v '^#' .env | xargs)
 
-# Cleaning up previous docker runs
-echo "=> Cleaning up previous runs"
-docker stop "$POSTGRES_DB_CONTAINER_NAME" 2>/dev/null || true
-docker rm "$POSTGRES_DB_CONTAINER_NAME" 2>/dev/null || true
-docker network rm "$NETWORK_NAME" 2>/dev/null || true
-echo "=== Cleanup complete."
+if [ "$MODE" = "service" ]; then
+  # Keep the database and its data; only replace the ETL container
+  echo "=> Replacing the ETL service container"
+  docker rm -f "$ETL_CONTAINER" 2>/dev/null || true
+  docker network inspect "$NETWORK_NAME" >/dev/null 2>&1 || docker network create "$NETWORK_NAME"
+else
+  # Cleaning up previous docker runs
+  echo "=> Cleaning up previous runs"
+  docker stop "$POSTGRES_DB_CONTAINER_NAME" 2>/dev/null || true
+  docker rm "$POSTGRES_DB_CONTAINER_NAME" 2>/dev/null || true
+  docker network rm "$NETWORK_NAME" 2>/dev/null || true
+  echo "=== Cleanup complete."
 
-# CREATE DOCKER NETWORK
-echo "=> Creating Docker network '$NETWORK_NAME' "
-docker network create "$NETWORK_NAME"
+  # CREATE DOCKER NETWORK
+  echo "=> Creating Docker network '$NETWORK_NAME' "
+  docker network create "$NETWORK_NAME"
+fi
 
 # BUILD POSTGRES DATABASE CONTAINER
-echo "=> Starting PostgreSQL container '$POSTGRES_DB_CONTAINER_NAME'"
-docker run -d \
+if [ -n "$(docker ps -q -f name="^${POSTGRES_DB_CONTAINER_NAME}$")" ]; then
+  echo "=> PostgreSQL container '$POSTGRES_DB_CONTAINER_NAME' is already running"
+else
+  docker rm "$POSTGRES_DB_CONTAINER_NAME" 2>/dev/null || true
+  echo "=> Starting PostgreSQL container '$POSTGRES_DB_CONTAINER_NAME'"
+  docker run -d \
     --name "$POSTGRES_DB_CONTAINER_NAME" \
     --network "$NETWORK_NAME" \
     -p 5433:5432 \
@@ -26,6 +41,7 @@ docker run -d \
     -e POSTGRES_DB="$POSTGRES_DB" \
     --restart always \
     postgres:14-alpine
+fi
 
 # BUILD THE PYTHON ETL APP IMAGE
 echo "=> Building the ETL app image '$ETL_IMAGE_NAME' "
@@ -39,12 +55,27 @@ until docker exec "$POSTGRES_DB_CONTAINER_NAME" pg_isready -q -U "$POSTGRES_USER
 done
 echo "   PostgreSQL is ready!"
 
-docker run --rm \
-  --name "$ETL_CONTAINER" \
-  --network "$NETWORK_NAME" \
-  --env-file .env \
-  "$ETL_IMAGE_NAME"
+# The response cache lives on the host so it outlasts the container
+mkdir -p cache
+
+if [ "$MODE" = "service" ]; then
+  docker run -d \
+    --name "$ETL_CONTAINER" \
+    --network "$NETWORK_NAME" \
+    --env-file .env \
+    -v "$(pwd)/cache:/docker_etl_pipeline/cache" \
+    --restart unless-stopped \
+    "$ETL_IMAGE_NAME" python service.py
 
+  echo "--- ETL Service Started: follow it with 'docker logs -f $ETL_CONTAINER' ---"
+else
+  docker run --rm \
+    --name "$ETL_CONTAINER" \
+    --network "$NETWORK_NAME" \
+    --env-file .env \
+    -v "$(pwd)/cache:/docker_etl_pipeline/cache" \
+    "$ETL_IMAGE_NAME"
 
-echo "--- ETL Pipeline Finished Successfully ---"
+  echo "--- ETL Pipeline Finished Successfully ---"
+fi
 
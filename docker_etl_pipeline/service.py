@@ -0,0 +1,129 @@
+import heapq
+import os
+import signal
+import threading
+import time
+from dotenv import load_dotenv
+from cache import ResponseCache
+from cities import CityRegistry
+from db import ensure_schema, get_engine
+from extract import CALLS_PER_MINUTE, MAX_WORKERS, USE_GROUP_ENDPOINT, ExtractWeatherData, RateLimiter, build_session
+from load import LoadWeatherData
+from pipeline import run_pipeline
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+load_dotenv()
+
+# Poll interval in seconds per city group, e.g. "capitals=600,lga=3600"
+POLL_INTERVALS = os.getenv("POLL_INTERVALS", "capitals=600")
+
+# How long to wait before retrying a cycle that failed, e.g. while Postgres restarts
+RETRY_SECONDS = int(os.getenv("SERVICE_RETRY_SECONDS", "60"))
+
+
+def parse_intervals(spec):
+    """
+    {group: seconds} from "group=seconds,group=seconds".
+    """
+    intervals = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        group, _, seconds = item.partition("=")
+        intervals[group.strip()] = int(seconds)
+
+    if not intervals:
+        raise ValueError("POLL_INTERVALS names no city groups.")
+    return intervals
+
+
+class WeatherService:
+    """
+    Runs the pipeline for each city group on its own interval, in one
+    resident process. The HTTP session, rate limiter, database engine,
+    city registry and response cache are created once and stay warm, so
+    a cycle costs only its API calls and database writes.
+    Groups run one at a time; one that falls behind runs as soon as the
+    current cycle ends instead of catching up on every missed run.
+    """
+    def __init__(self, intervals=None):
+        self.intervals = intervals or parse_intervals(POLL_INTERVALS)
+        self.stopping = threading.Event()
+
+        # Shared by every group: the API quota is per key, not per group
+        self.session = build_session(MAX_WORKERS)
+        self.rate_limiter = RateLimiter(CALLS_PER_MINUTE)
+        self.cache = ResponseCache.from_env() or False
+        self.loader = LoadWeatherData()
+        self.registry = None
+
+        # Once the API refuses /group, later cycles go straight to per-ID calls
+        self.use_group_endpoint = USE_GROUP_ENDPOINT
+
+    def _get_registry(self):
+        if self.registry is None:
+            engine = get_engine()
+            ensure_schema(engine)
+            self.registry = CityRegistry(engine)
+        return self.registry
+
+    def run_cycle(self, group):
+        """
+        One pipeline run for a group. Returns True on success; a failure is
+        logged and the service keeps running.
+        """
+        started = time.monotonic()
+        extractor = None
+        try:
+            extractor = ExtractWeatherData(group=group, session=self.session, rate_limiter=self.rate_limiter,
+                                           registry=self._get_registry(), cache=self.cache,
+                                           use_group_endpoint=self.use_group_endpoint)
+            loaded = run_pipeline(extractor=extractor, loader=self.loader)
+            logging.info(f"Cycle for '{group}' finished in {time.monotonic() - started:.1f}s, "
+                         f"{loaded} readings loaded.")
+            return True
+
+        except Exception as e:
+            logging.error(f"Cycle for '{group}' failed after {time.monotonic() - started:.1f}s: {e}")
+            return False
+
+        finally:
+            if extractor is not None:
+                self.use_group_endpoint = extractor.use_group_endpoint
+
+    def run(self):
+        logging.info(f"Weather service started, polling {self.intervals} (seconds).")
+
+        # (next run, group); every group runs once at start-up
+        now = time.monotonic()
+        schedule = [(now, group) for group in self.intervals]
+        heapq.heapify(schedule)
+
+        while not self.stopping.is_set():
+            due, group = schedule[0]
+            if self.stopping.wait(max(0.0, due - time.monotonic())):
+                break
+
+            heapq.heappop(schedule)
+            ok = self.run_cycle(group)
+
+            interval = self.intervals[group] if ok else min(RETRY_SECONDS, self.intervals[group])
+            heapq.heappush(schedule, (max(due + interval, time.monotonic()), group))
+
+        self.session.close()
+        logging.info("Weather service stopped.")
+
+    def stop(self, *_):
+        self.stopping.set()
+
+
+if __name__ == "__main__":
+    service = WeatherService()
+
+    # docker stop sends SIGTERM; finish the current cycle and exit
+    signal.signal(signal.SIGTERM, service.stop)
+    signal.signal(signal.SIGINT, service.stop)
+
+    service.run()
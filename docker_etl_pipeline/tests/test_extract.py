@@ -0,0 +1,201 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import extract
+from cache import ResponseCache
+from cities import city_queries
+from extract import ExtractWeatherData, RateLimiter
+
+QUERIES = city_queries("capitals")
+CITY_IDS = {query: 1000 + i for i, query in enumerate(QUERIES)}
+
+
+def payload(city_id, name=None):
+    return {'id': city_id, 'name': name or f"City{city_id}", 'dt': int(time.time()),
+            'main': {'temp': 25.0}, 'sys': {'country': 'NG'}}
+
+
+class WeatherHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in for the OpenWeather API: /weather by id or q, and /group
+    unless the server is set to refuse it. IDs in fail_once get one 503.
+    Every call is recorded on the server as (endpoint, params).
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        endpoint = url.path.rsplit("/", 1)[-1]
+        with server.lock:
+            server.calls.append((endpoint, params))
+
+        if endpoint == "group":
+            if server.refuse_group:
+                return self._send(401, {'cod': 401, 'message': 'Invalid API key for /group'})
+            ids = [int(city_id) for city_id in params['id'].split(",")]
+            return self._send(200, {'cnt': len(ids), 'list': [payload(city_id) for city_id in ids]})
+
+        if 'id' in params:
+            city_id = int(params['id'])
+            with server.lock:
+                if city_id in server.fail_once:
+                    server.fail_once.remove(city_id)
+                    return self._send(503, {'cod': 503}, {'Retry-After': '0'})
+            return self._send(200, payload(city_id))
+
+        name = params['q'].split(",")[0]
+        return self._send(200, payload(CITY_IDS[params['q']], name))
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class WeatherServer(ThreadingHTTPServer):
+    # Room for every fetch thread to connect at once
+    request_queue_size = 64
+
+
+class FakeRegistry:
+    """
+    CityRegistry without a database: `known` maps queries to stored IDs.
+    """
+
+    def __init__(self, known=None, current=()):
+        self.known = dict(known or {})
+        self.current_ids = set(current)
+        self.remembered = {}
+
+    def lookup(self, queries):
+        return {query: self.known[query] for query in queries if query in self.known}
+
+    def current(self, city_ids, max_age_seconds):
+        return self.current_ids & set(city_ids)
+
+    def remember(self, resolved, group):
+        self.remembered.update(resolved)
+
+
+@pytest.fixture
+def server():
+    server = WeatherServer(("127.0.0.1", 0), WeatherHandler)
+    server.lock = threading.Lock()
+    server.calls = []
+    server.refuse_group = False
+    server.fail_once = set()
+
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_extractor(server, monkeypatch):
+    monkeypatch.setenv("API_KEY", "test-key")
+    monkeypatch.setattr(extract, "RETRY_BACKOFF", 0)
+
+    def make(registry, cache=False, **kwargs):
+        extractor = ExtractWeatherData(group="capitals", registry=registry, cache=cache,
+                                       rate_limiter=RateLimiter(6000), **kwargs)
+        extractor.base_url = f"http://127.0.0.1:{server.server_port}"
+        return extractor
+
+    return make
+
+
+def endpoints(server):
+    return [endpoint for endpoint, _ in server.calls]
+
+
+def test_known_ids_are_fetched_20_per_group_call(server, make_extractor):
+    extractor = make_extractor(FakeRegistry(CITY_IDS))
+
+    data = extractor.extract()
+
+    assert sorted(city['id'] for city in data) == sorted(CITY_IDS.values())
+    assert endpoints(server) == ["group", "group"]
+    assert sorted(len(params['id'].split(",")) for _, params in server.calls) == [17, 20]
+    assert extractor.api_calls == 2
+
+
+def test_refused_group_falls_back_to_one_call_per_id(server, make_extractor):
+    server.refuse_group = True
+    extractor = make_extractor(FakeRegistry(CITY_IDS), max_workers=1)
+
+    data = extractor.extract()
+
+    assert sorted(city['id'] for city in data) == sorted(CITY_IDS.values())
+    # The second group is not tried once the first is refused
+    assert endpoints(server).count("group") == 1
+    assert endpoints(server).count("weather") == len(CITY_IDS)
+    assert extractor.use_group_endpoint is False
+
+
+def test_unknown_cities_are_resolved_by_name_and_remembered(server, make_extractor):
+    registry = FakeRegistry()
+    extractor = make_extractor(registry)
+
+    data = extractor.extract()
+
+    assert len(data) == len(QUERIES)
+    assert sorted(params['q'] for _, params in server.calls) == sorted(QUERIES)
+    assert {query: city['id'] for query, city in registry.remembered.items()} == CITY_IDS
+
+
+def test_current_cities_are_not_fetched(server, make_extractor):
+    current = list(CITY_IDS.values())[:30]
+    extractor = make_extractor(FakeRegistry(CITY_IDS, current=current))
+
+    data = extractor.extract()
+
+    assert len(data) == len(CITY_IDS) - 30
+    assert endpoints(server) == ["group"]
+
+
+def test_cached_responses_make_no_calls(server, make_extractor, tmp_path):
+    cache = ResponseCache(tmp_path / "responses.db")
+
+    make_extractor(FakeRegistry(CITY_IDS), cache=cache).extract()
+    make_extractor(FakeRegistry(), cache=cache).extract()
+    server.calls.clear()
+
+    by_id = make_extractor(FakeRegistry(CITY_IDS), cache=cache)
+    by_name = make_extractor(FakeRegistry(), cache=cache)
+
+    assert len(by_id.extract()) == len(CITY_IDS)
+    assert len(by_name.extract()) == len(QUERIES)
+    assert server.calls == []
+    assert by_id.api_calls == by_name.api_calls == 0
+
+
+def test_retries_take_a_rate_limiter_token(server, make_extractor):
+    server.refuse_group = True
+    server.fail_once = set(list(CITY_IDS.values())[:5])
+    extractor = make_extractor(FakeRegistry(CITY_IDS), use_group_endpoint=False)
+
+    tokens = []
+    acquire = extractor.rate_limiter.acquire
+    extractor.rate_limiter.acquire = lambda: tokens.append(1) or acquire()
+
+    data = extractor.extract()
+
+    assert len(data) == len(CITY_IDS)
+    assert len(server.calls) == len(CITY_IDS) + 5
+    assert len(tokens) == extractor.api_calls == len(server.calls)
@@ -1,12 +1,54 @@
-from datetime import datetime, timezone
-from extract import ExtractWeatherData
+import pandas as pd
 import logging
 
+# Output columns, in the order _flatten returns them
+COLUMNS = [
+    "city_id", "city_name", "country_code",
+    "temperature_celsius", "feels_like_celsius", "min_temperature_celsius", "max_temperature_celsius",
+    "humidity_percent", "pressure_hpa", "visibility_meters", "wind_speed_ms", "wind_direction_deg",
+    "weather_condition", "weather_description",
+    "observation_timestamp_utc", "sunrise_utc", "sunset_utc",
+]
+
+# Unix epoch seconds, converted to UTC timestamps
+EPOCH_COLUMNS = ["observation_timestamp_utc", "sunrise_utc", "sunset_utc"]
+
+# Numeric columns; the integer ones are nullable so a missing value stays NULL
+INTEGER_COLUMNS = ["city_id", "humidity_percent", "pressure_hpa", "visibility_meters", "wind_direction_deg"]
+FLOAT_COLUMNS = ["temperature_celsius", "feels_like_celsius", "min_temperature_celsius",
+                 "max_temperature_celsius", "wind_speed_ms"]
+
+# A record without these cannot be stored and is skipped
+REQUIRED_COLUMNS = ["city_id", "city_name", "country_code", "observation_timestamp_utc"]
+
+
+def _flatten(city_data):
+    """
+    One payload as a tuple of raw COLUMNS values; missing fields are None.
+    """
+    main = city_data.get('main') or {}
+    wind = city_data.get('wind') or {}
+    sys = city_data.get('sys') or {}
+    weather = (city_data.get('weather') or [{}])[0]
+
+    return (
+        city_data.get('id'), city_data.get('name'), sys.get('country'),
+        main.get('temp'), main.get('feels_like'), main.get('temp_min'), main.get('temp_max'),
+        main.get('humidity'), main.get('pressure'), city_data.get('visibility'),
+        wind.get('speed'), wind.get('deg'),
+        weather.get('main'), weather.get('description'),
+        city_data.get('dt'), sys.get('sunrise'), sys.get('sunset'),
+    )
+
+
 class TransformWeatherData:
-    def __init__(self):
-        self.extracted_weather_data = ExtractWeatherData().extract()
+    """
+    Flattens raw city payloads into rows for the cities and
+    weather_readings tables, a batch at a time. Takes batches of payloads,
+    e.g. micro-batches of the stream from ExtractWeatherData.stream().
+    """
 
-    def transform(self, city_data):
+    def transform_batch(self, batch) -> pd.DataFrame:
 
         """ This is what a typical city weather data looks like.
             {'coord': {'lon': 7.4896, 'lat': 5.5263},
@@ -22,54 +64,53 @@ class TransformWeatherData:
             'timezone': 3600,
             'id': 2320576,
             'name': 'Umuahia',
-            'cod': 200} 
+            'cod': 200}
+
+            The whole batch is flattened in one pass and every column is then
+            converted at once; epoch seconds become native UTC timestamps and
+            daylight_duration_hours is derived from sunrise and sunset.
+        """
+        weather_df = pd.DataFrame.from_records([_flatten(city_data) for city_data in batch], columns=COLUMNS)
+
+        for column in ["city_name", "country_code", "weather_condition", "weather_description"]:
+            weather_df[column] = weather_df[column].astype("string")
+
+        for column in INTEGER_COLUMNS:
+            weather_df[column] = pd.to_numeric(weather_df[column], errors="coerce").round().astype("Int64")
+
+        for column in FLOAT_COLUMNS:
+            weather_df[column] = pd.to_numeric(weather_df[column], errors="coerce").astype("float64")
+
+        # enrichment: sunset - sunrise on the epoch seconds, in hours
+        sunrise = pd.to_numeric(weather_df["sunrise_utc"], errors="coerce")
+        sunset = pd.to_numeric(weather_df["sunset_utc"], errors="coerce")
+        weather_df["daylight_duration_hours"] = ((sunset - sunrise) / 3600).round(2)
+
+        for column in EPOCH_COLUMNS:
+            weather_df[column] = pd.to_datetime(pd.to_numeric(weather_df[column], errors="coerce"),
+                                                unit="s", utc=True)
+
+        # If any required field is missing or malformed, skip that record.
+        valid = weather_df[REQUIRED_COLUMNS].notna().all(axis=1)
+        if not valid.all():
+            skipped = weather_df.loc[~valid, "city_name"].fillna("Unknown City").tolist()
+            logging.info(f"Warning: Could not transform data for {skipped}. Skipping {len(skipped)} records.")
+            weather_df = weather_df[valid]
+
+        return weather_df.reset_index(drop=True)
+
+    def transform_batches(self, batches):
+        """
+        Lazily transform each batch of payloads as it arrives.
         """
-        try:
-            #select important information
-            #flattening the data
-            transformed_record = {
-                "city_id": city_data['id'],
-                "city_name": city_data['name'],
-                "country_code": city_data['sys']['country'],
-                "temperature_celsius": city_data['main']['temp'],
-                "feels_like_celsius": city_data['main']['feels_like'],
-                "min_temperature_celsius": city_data['main']['temp_min'],
-                "max_temperature_celsius": city_data['main']['temp_max'],
-                "humidity_percent": city_data['main']['humidity'],
-                "pressure_hpa": city_data['main']['pressure'],
-                "visibility_meters": city_data.get('visibility'),
-                "wind_speed_ms": city_data['wind']['speed'],
-                "wind_direction_deg": city_data['wind']['deg'],
-                "weather_condition": city_data['weather'][0]['main'],
-                "weather_description": city_data['weather'][0]['description'],
-            }
-            # Get unix timestamps from the raw data & convert them to datetime objects
-            # enrichment
-            observation_dt = datetime.fromtimestamp(city_data['dt'], tz=timezone.utc)
-            sunrise_dt = datetime.fromtimestamp(city_data['sys']['sunrise'], tz=timezone.utc)
-            sunset_dt = datetime.fromtimestamp(city_data['sys']['sunset'], tz=timezone.utc)
-
-            # Format them into readable strings
-            transformed_record["observation_timestamp_utc"] = observation_dt.strftime('%Y-%m-%d %H:%M:%S')
-            transformed_record["sunrise_utc"] = sunrise_dt.strftime('%Y-%m-%d %H:%M:%S')
-            transformed_record["sunset_utc"] = sunset_dt.strftime('%Y-%m-%d %H:%M:%S')
-
-            return transformed_record
-
-        except (KeyError, IndexError, TypeError) as e:
-            # If any expected key is missing or the data format is wrong, skip this record.
-            city_name = city_data.get('name', 'Unknown City')
-            logging.info(f"Warning: Could not transform data for '{city_name}'. Error: {e}. Skipping record.")
-            return None
-        
-    def run_transform(self,):
-        transformed_weather_data = []
-        
-        for city_data in self.extracted_weather_data:
-            transformed_city = self.transform(city_data)
-            if transformed_city:
-                transformed_weather_data.append(transformed_city)
-
-        logging.info(f"Transformation complete. Successfully transformed {len(transformed_weather_data)} records.")
-
-        return transformed_weather_data
+        transformed = 0
+
+        for batch in batches:
+            weather_df = self.transform_batch(batch)
+            transformed += len(weather_df)
+            yield weather_df
+
+        logging.info(f"Transformation complete. Successfully transformed {transformed} records.")
+
+    def run_transform(self, weather_data):
+        return self.transform_batch(list(weather_data))
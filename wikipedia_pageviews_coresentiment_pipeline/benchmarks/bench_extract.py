@@ -0,0 +1,105 @@
+"""
+Benchmark the byte-level pageview matcher against the original text loop.
+
+Generates a synthetic hourly dump (10M lines by default) and times both
+matchers over it. Run from the project root:
+
+    python benchmarks/bench_extract.py --lines 10000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "dags"))
+
+# Keep the matcher's stage metrics out of the database and out of the timings
+os.environ.setdefault("WIKIPEDIA_METRICS_TO_DB", "0")
+
+from scripts.extract_pageviews import ExtractPageViews
+
+COMPANIES = {
+    'Amazon': 'en Amazon_(company)',
+    'Apple': 'en Apple_Inc.',
+    'Facebook': 'en Facebook',
+    'Google': 'en Google',
+    'Microsoft': 'en Microsoft'
+}
+
+# Rough share of domain codes in a real dump
+DOMAINS = ["en"] * 30 + ["en.m"] * 25 + ["de", "de.m", "fr", "fr.m", "es", "es.m", "ja", "ja.m",
+                                         "ru", "ru.m", "it", "zh", "pt", "commons.m", "www.wd"] * 3
+
+
+def generate_dump(path, lines, seed=42):
+    """
+    Write a synthetic pageview file with `lines` rows and the tracked
+    companies mixed in once each.
+    """
+    rng = random.Random(seed)
+    hits = {rng.randrange(lines): title for title in COMPANIES.values()}
+
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(lines):
+            if i in hits:
+                f.write(f"{hits[i]} {rng.randint(100, 500)} 0\n")
+            else:
+                f.write(f"{rng.choice(DOMAINS)} Title_{rng.randrange(5_000_000)} {rng.randint(1, 50)} 0\n")
+
+
+def legacy_extract(path, companies):
+    """
+    The original text loop: strip, split and build an f-string for every line.
+    """
+    page_titles = {v: k for k, v in companies.items()}
+    results = {company: 0 for company in companies}
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.strip().split(" ")
+            if len(parts) < 4:
+                continue
+            domain_code, page_title, view_count, response_size = parts[0], parts[1], parts[2], parts[3]
+            full_title = f"{domain_code} {page_title}"
+            if full_title in page_titles:
+                results[page_titles[full_title]] = {'domain_code': domain_code,
+                                                    'page_title': page_title,
+                                                    'views': view_count,
+                                                    'resp_size': response_size}
+    return results
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lines", type=int, default=10_000_000)
+    parser.add_argument("--dump", type=Path, help="reuse an existing dump instead of generating one")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.dump
+        if path is None:
+            path = Path(tmp) / "pageviews-synthetic"
+            print(f"Generating {args.lines:,} lines at {path} ...")
+            generate_dump(path, args.lines)
+
+        legacy, legacy_secs = timed(lambda: legacy_extract(path, COMPANIES))
+        fast, fast_secs = timed(lambda: ExtractPageViews(path, COMPANIES).extract())
+
+        if legacy != fast:
+            raise SystemExit(f"Matchers disagree:\n legacy={legacy}\n fast={fast}")
+
+        print(f"legacy text loop : {legacy_secs:7.2f}s")
+        print(f"byte fast path   : {fast_secs:7.2f}s  ({legacy_secs / fast_secs:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
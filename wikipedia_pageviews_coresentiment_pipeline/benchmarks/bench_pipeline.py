@@ -0,0 +1,383 @@
+"""
+Benchmark the pageview pipeline stages on synthetic dumps.
+
+For every scale a dump is generated once (plain and gzipped, kept in
+--workdir for later runs) and each case runs in a fresh process, so the
+peak RSS reported is the case's own:
+
+  download  DownloadPageViews.download_file from a local HTTP server (fetch + decompress)
+  stream    DownloadPageViews.iter_lines fed straight into ExtractPageViews.extract_lines
+  extract   ExtractPageViews.extract on the plain and on the .gz dump
+  load      LoadPageViews.load_data for one hour and load_batch for --load-companies x --load-hours
+
+Loads run against an in-process stand-in for Postgres that only does the
+Python side (company cache, CSV staging), or with --postgres against the
+database in the WIKIPEDIA_DB_* environment variables. Use a scratch
+database: the benchmark writes to a 2099-01 partition and drops it again.
+
+Results go to --output as JSON; --compare prints the speedup against an
+earlier run. Run from the project root:
+
+    python benchmarks/bench_pipeline.py --scales 1M 10M 50M --output bench.json
+    python benchmarks/bench_pipeline.py --scales 1M --compare bench.json
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "dags"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+# Keep the harness's own stage metrics out of the database
+os.environ.setdefault("WIKIPEDIA_METRICS_TO_DB", "0")
+
+from bench_extract import COMPANIES, generate_dump
+
+# Dumps are served as 2025-10-22, one hour per scale
+DUMP_DAY = (2025, 10, 22)
+
+# Loads go to a month no real data lives in, dropped before and after each case
+LOAD_MONTH = datetime(2099, 1, 1, tzinfo=timezone.utc)
+
+
+def parse_scale(value):
+    """
+    '1M' -> 1_000_000, '250k' -> 250_000, '5000' -> 5000.
+    """
+    multipliers = {"k": 1_000, "m": 1_000_000}
+    suffix = value[-1].lower()
+    if suffix in multipliers:
+        return int(float(value[:-1]) * multipliers[suffix])
+    return int(value)
+
+
+def dump_name(hour):
+    year, month, day = DUMP_DAY
+    return f"pageviews-{year}{month:02d}{day:02d}-{hour:02d}0000"
+
+
+def prepare_dumps(workdir, scales):
+    """
+    Generate the plain and gzipped dump for each scale unless the workdir
+    already has them, and lay the .gz files out like the Wikimedia dump
+    tree (with md5sums.txt) under workdir/serve.
+    Returns {lines: (plain path, gz path, hour)}.
+    """
+    year, month, _ = DUMP_DAY
+    serve_dir = workdir / "serve" / f"{year}" / f"{year}-{month:02d}"
+    serve_dir.mkdir(parents=True, exist_ok=True)
+
+    dumps = {}
+    checksums = []
+
+    for hour, lines in enumerate(scales):
+        plain = workdir / f"synthetic-{lines}"
+        gz = serve_dir / f"{dump_name(hour)}.gz"
+
+        if not plain.exists():
+            print(f"Generating {lines:,} lines at {plain} ...", file=sys.stderr)
+            generate_dump(plain, lines)
+            gz.unlink(missing_ok=True)
+
+        if not gz.exists():
+            with open(plain, "rb") as src, gzip.open(gz, "wb") as dst:
+                shutil.copyfileobj(src, dst, length=1024 * 1024)
+
+        digest = hashlib.md5()
+        with open(gz, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        checksums.append(f"{digest.hexdigest()}  {gz.name}\n")
+
+        dumps[lines] = (plain, gz, hour)
+
+    (serve_dir / "md5sums.txt").write_text("".join(checksums))
+    return dumps
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve(directory, port_pipe):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(_QuietHandler, directory=str(directory)))
+    port_pipe.send(server.server_address[1])
+    server.serve_forever()
+
+
+class _Result:
+    def __init__(self, rows=(), rowcount=0):
+        self._rows = list(rows)
+        self.rowcount = rowcount
+
+    def fetchall(self):
+        return self._rows
+
+    def scalar(self):
+        return self._rows[0][0] if self._rows else None
+
+
+class StandInConnection:
+    """
+    Answers the statements LoadPageViews issues without a database, so the
+    load benchmark measures the Python side: company ID resolution, CSV
+    staging and the COPY buffer. Staged rows are counted, not stored.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.staged = 0
+        self.connection = self
+
+    # Engine interface
+    def begin(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    # Connection interface
+    def execute(self, statement, params=None):
+        sql = str(statement)
+
+        if "SELECT page_title, id FROM companies" in sql:
+            return _Result(self.ids.items())
+        if "INSERT INTO companies" in sql:
+            inserted = [(title, self.ids.setdefault(title, len(self.ids) + 1)) for title in params["titles"]]
+            return _Result(inserted, len(inserted))
+        if "INSERT INTO pageviews_hourly" in sql:
+            return _Result(rowcount=self.staged)
+        return _Result()
+
+    # DBAPI cursor interface
+    def cursor(self):
+        return self
+
+    def copy_expert(self, sql, buffer):
+        self.staged = sum(1 for _ in buffer)
+
+
+def _bench_companies(count):
+    return {f"Bench company {i}": f"en Bench_{i}" for i in range(count)}
+
+
+def _synthetic_results(companies, seed):
+    return {name: {'domain_code': 'en', 'page_title': title.split(" ", 1)[1],
+                   'views': (seed * 7919 + i) % 5000, 'resp_size': 0}
+            for i, (name, title) in enumerate(companies.items())}
+
+
+def _drop_bench_data(engine):
+    from sqlalchemy import text
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS pageviews_hourly_y{LOAD_MONTH.year}m{LOAD_MONTH.month:02d};"))
+        conn.execute(text("DELETE FROM companies WHERE page_title LIKE 'Bench\\_%';"))
+
+
+def run_case(case, options):
+    """
+    Run one case in this (fresh) process and return its measurements.
+    """
+    from scripts import metrics
+    from scripts.download_pageviews import DownloadPageViews
+    from scripts.extract_pageviews import ExtractPageViews
+    from scripts.load_pageviews import LoadPageViews
+
+    # The per-stage records are collected below; keep the pipeline's INFO logs quiet
+    logging.getLogger().setLevel(logging.WARNING)
+
+    # Memory held by the imports alone, before the case does any work
+    baseline_rss_kb = metrics.peak_rss_kb()
+
+    started = time.perf_counter()
+
+    if case["name"] == "download":
+        with tempfile.TemporaryDirectory() as data_dir:
+            year, month, day = DUMP_DAY
+            downloader = DownloadPageViews(day=day, hour=case["hour"], year=year, month=month,
+                                           base_url=options["base_url"], data_dir=data_dir)
+            if downloader.download_file(decompress=True) is None:
+                raise RuntimeError("Download failed")
+            wall = time.perf_counter() - started
+
+    elif case["name"] == "stream":
+        with tempfile.TemporaryDirectory() as data_dir:
+            year, month, day = DUMP_DAY
+            downloader = DownloadPageViews(day=day, hour=case["hour"], year=year, month=month,
+                                           base_url=options["base_url"], data_dir=data_dir)
+            ExtractPageViews(None, COMPANIES).extract_lines(downloader.iter_lines())
+            wall = time.perf_counter() - started
+
+    elif case["name"] == "extract":
+        if ExtractPageViews(case["path"], COMPANIES).extract() is None:
+            raise RuntimeError(f"Extract failed for {case['path']}")
+        wall = time.perf_counter() - started
+
+    elif case["name"] in ("load_hour", "load_batch"):
+        companies = _bench_companies(case["companies"])
+        batch = [(LOAD_MONTH + timedelta(hours=h), _synthetic_results(companies, h)) for h in range(case["hours"])]
+
+        loader = LoadPageViews()
+        if options["postgres"]:
+            loader.setup_database()
+            _drop_bench_data(loader.engine)
+        else:
+            loader.engine = StandInConnection()
+
+        started = time.perf_counter()
+        if case["name"] == "load_hour":
+            hour_ts, results = batch[0]
+            loader.companies_pageviews, loader.hour_ts = results, hour_ts
+            loader.load_data()
+        else:
+            loader.load_batch(batch)
+        wall = time.perf_counter() - started
+
+        if options["postgres"]:
+            _drop_bench_data(loader.engine)
+
+    else:
+        raise ValueError(f"Unknown case {case['name']}")
+
+    stages = list(metrics.RECORDS)
+    totals = {key: sum(stage[key] for stage in stages) for key in ("bytes", "lines", "rows")}
+    if case["name"] == "download":
+        # Report the compressed bytes fetched, not those written by the decompress stage
+        totals["bytes"] = sum(stage["bytes"] for stage in stages if stage["stage"] == "download")
+
+    return {
+        **{key: value for key, value in case.items() if key not in ("path", "hour")},
+        "wall_seconds": wall,
+        **totals,
+        "bytes_per_sec": totals["bytes"] / wall if totals["bytes"] else None,
+        "lines_per_sec": totals["lines"] / wall if totals["lines"] else None,
+        "peak_rss_kb": metrics.peak_rss_kb(),
+        "baseline_rss_kb": baseline_rss_kb,
+        "stages": [{"stage": stage["stage"], "wall_seconds": stage["wall_seconds"], "bytes": stage["bytes"],
+                    "lines": stage["lines"], "rows": stage["rows"]} for stage in stages],
+    }
+
+
+def case_key(result):
+    return ":".join(str(result.get(key, "")) for key in ("name", "format", "scale"))
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous_path, report):
+    previous = {case_key(result): result for result in json.loads(Path(previous_path).read_text())["results"]}
+
+    print(f"{'case':32} {'before':>10} {'after':>10} {'speedup':>8}")
+    for result in report["results"]:
+        key = case_key(result)
+        before = previous.get(key)
+        if before is None:
+            print(f"{key:32} {'-':>10} {result['wall_seconds']:10.3f}")
+            continue
+        print(f"{key:32} {before['wall_seconds']:10.3f} {result['wall_seconds']:10.3f} "
+              f"{before['wall_seconds'] / result['wall_seconds']:7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", nargs="+", default=["1M", "10M"],
+                        help="dump sizes in lines, e.g. 1M 10M 50M")
+    parser.add_argument("--cases", nargs="+", default=["download", "stream", "extract", "load"],
+                        choices=["download", "stream", "extract", "load"])
+    parser.add_argument("--workdir", type=Path, default=Path(tempfile.gettempdir()) / "pageviews-bench",
+                        help="where generated dumps are kept between runs")
+    parser.add_argument("--postgres", action="store_true",
+                        help="load into the WIKIPEDIA_DB_* database instead of the in-process stand-in")
+    parser.add_argument("--load-companies", type=int, default=2000)
+    parser.add_argument("--load-hours", type=int, default=24)
+    parser.add_argument("--output", type=Path, help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", type=Path, help="earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    scales = [parse_scale(scale) for scale in args.scales]
+    args.workdir.mkdir(parents=True, exist_ok=True)
+    dumps = prepare_dumps(args.workdir, scales)
+
+    spawn = multiprocessing.get_context("spawn")
+    receiver, sender = spawn.Pipe(duplex=False)
+    server = spawn.Process(target=_serve, args=(args.workdir / "serve", sender), daemon=True)
+    server.start()
+    options = {"base_url": f"http://127.0.0.1:{receiver.recv()}/", "postgres": args.postgres}
+
+    cases = []
+    for lines in scales:
+        plain, gz, hour = dumps[lines]
+        if "download" in args.cases:
+            cases.append({"name": "download", "format": "gz", "scale": lines, "hour": hour})
+        if "stream" in args.cases:
+            cases.append({"name": "stream", "format": "gz", "scale": lines, "hour": hour})
+        if "extract" in args.cases:
+            cases.append({"name": "extract", "format": "plain", "scale": lines, "path": str(plain)})
+            cases.append({"name": "extract", "format": "gz", "scale": lines, "path": str(gz)})
+    if "load" in args.cases:
+        backend = "postgres" if args.postgres else "standin"
+        cases.append({"name": "load_hour", "format": backend, "scale": len(COMPANIES),
+                      "companies": len(COMPANIES), "hours": 1})
+        cases.append({"name": "load_batch", "format": backend, "scale": args.load_companies * args.load_hours,
+                      "companies": args.load_companies, "hours": args.load_hours})
+
+    results = []
+    try:
+        for case in cases:
+            # A fresh process per case keeps peak RSS and caches per case
+            with spawn.Pool(1) as pool:
+                result = pool.apply(run_case, (case, options))
+            print(f"{case_key(result):32} {result['wall_seconds']:8.3f}s  "
+                  f"peak RSS {result['peak_rss_kb'] / 1024:7.1f} MB", file=sys.stderr)
+            results.append(result)
+    finally:
+        server.terminate()
+
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "host": socket.gethostname(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        compare(args.compare, report)
+
+
+if __name__ == "__main__":
+    main()
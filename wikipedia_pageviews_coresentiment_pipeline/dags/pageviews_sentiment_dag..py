@@ -1,12 +1,16 @@
-from datetime import datetime, timedelta
+from datetime import datetime
 from airflow.sdk import DAG
 from airflow.providers.standard.operators.python import PythonOperator
 import logging
 
 from scripts.download_pageviews import download_task_callable
-from scripts.extract_pageviews import extract_task_callable
+from scripts.extract_pageviews import extract_task_callable, extract_watchlist_task_callable
 from scripts.load_pageviews import load_task_callable
 from scripts.sentiment_analysis import analysis_callable
+from scripts.stream_pageviews import stream_extract_task_callable
+from scripts.mapped_pageviews import (plan_hours_callable, download_hour_callable, extract_hour_callable,
+                                      load_hours_callable, analyse_hours_callable)
+from scripts.parquet_pageviews import write_parquet_task_callable
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -19,15 +23,25 @@ companies = {
             'Microsoft': 'en Microsoft'
         }
 
+# Pools cap each stage across the whole cluster; airflow-init creates them.
+# Keep the download pool small to stay polite to dumps.wikimedia.org.
+DOWNLOAD_POOL = 'pageviews_download'
+EXTRACT_POOL = 'pageviews_extract'
+
 
 with DAG(
     dag_id='wikipedia_pageviews_dag',
     schedule=None,  # Run manually
     start_date=datetime(2025, 10, 1),
     params={
+        "year": 2025,
+        "month": 10,
         "day": 22,
         "hour": 10,
-        "companies" : companies
+        "companies" : companies,
+        "stream_gzip": True,
+        "extract_workers": 1,
+        "parquet_output": False
     }
 ):
     
@@ -48,4 +62,120 @@ with DAG(
         task_id='analyse',
         python_callable=analysis_callable)
     
-    download_pageviews_task >> extract_pageviews_task >> load_pageviews_task >> sentiment_task
\ No newline at end of file
+    parquet_task = PythonOperator(
+        task_id='write_parquet',
+        python_callable=write_parquet_task_callable)
+
+    download_pageviews_task >> extract_pageviews_task >> load_pageviews_task >> sentiment_task
+    extract_pageviews_task >> parquet_task
+
+
+# Same pipeline, but the download and extract stages run as one streaming task.
+# The task keeps the 'extract' id so 'load' finds its handoff reference unchanged.
+with DAG(
+    dag_id='wikipedia_pageviews_stream_dag',
+    schedule=None,  # Run manually
+    start_date=datetime(2025, 10, 1),
+    params={
+        "year": 2025,
+        "month": 10,
+        "day": 22,
+        "hour": 10,
+        "companies" : companies
+    }
+):
+
+    stream_extract_task = PythonOperator(
+        task_id='extract',
+        python_callable=stream_extract_task_callable)
+
+    load_pageviews_task = PythonOperator(
+        task_id='load',
+        python_callable=load_task_callable)
+
+    sentiment_task = PythonOperator(
+        task_id='analyse',
+        python_callable=analysis_callable)
+
+    stream_extract_task >> load_pageviews_task >> sentiment_task
+
+
+# Same pipeline for any set of hours: each hour downloads and extracts as its
+# own mapped task instance, so a backfill or catch-up spreads over every worker.
+# Give either a list of 'hours' or a 'start'/'end' range (end exclusive);
+# 'hours' takes precedence. load writes batch_size hours per transaction.
+with DAG(
+    dag_id='wikipedia_pageviews_mapped_dag',
+    schedule=None,  # Run manually
+    start_date=datetime(2025, 10, 1),
+    params={
+        "hours": [],
+        "start": "2025-10-01T00:00:00",
+        "end": "2025-10-02T00:00:00",
+        "companies" : companies,
+        "batch_size": 24,
+        "signal_window": 24
+    }
+):
+
+    plan_task = PythonOperator(
+        task_id='plan',
+        python_callable=plan_hours_callable)
+
+    download_pageviews_task = PythonOperator.partial(
+        task_id='download',
+        python_callable=download_hour_callable,
+        pool=DOWNLOAD_POOL
+    ).expand(op_kwargs=plan_task.output)
+
+    extract_pageviews_task = PythonOperator.partial(
+        task_id='extract',
+        python_callable=extract_hour_callable,
+        pool=EXTRACT_POOL
+    ).expand(op_kwargs=download_pageviews_task.output)
+
+    # Passing the mapped outputs as kwargs makes these fan-in tasks
+    load_pageviews_task = PythonOperator(
+        task_id='load',
+        python_callable=load_hours_callable,
+        op_kwargs={"refs": extract_pageviews_task.output})
+
+    PythonOperator(
+        task_id='analyse',
+        python_callable=analyse_hours_callable,
+        op_kwargs={"summary": load_pageviews_task.output})
+
+
+# Aggregates every domain code for a large watchlist of titles in one pass.
+# Set watchlist_from_db to use every page_title in the companies table.
+with DAG(
+    dag_id='wikipedia_pageviews_watchlist_dag',
+    schedule=None,  # Run manually
+    start_date=datetime(2025, 10, 1),
+    params={
+        "year": 2025,
+        "month": 10,
+        "day": 22,
+        "hour": 10,
+        "watchlist": ["Amazon_(company)", "Apple_Inc.", "Facebook", "Google", "Microsoft"],
+        "watchlist_from_db": False,
+        "domain_codes": None,
+        "stream_gzip": True,
+        "parquet_output": True
+    }
+):
+
+    download_pageviews_task = PythonOperator(
+        task_id="download",
+        python_callable=download_task_callable
+    )
+
+    extract_watchlist_task = PythonOperator(
+        task_id='extract',
+        python_callable=extract_watchlist_task_callable)
+
+    parquet_task = PythonOperator(
+        task_id='write_parquet',
+        python_callable=write_parquet_task_callable)
+
+    download_pageviews_task >> extract_watchlist_task >> parquet_task
\ No newline at end of file
@@ -0,0 +1,168 @@
+"""
+Backfill an hour range outside Airflow, in one process. From dags/:
+
+    python -m scripts.backfill_pageviews --start 2025-10-01T00:00 --end 2025-10-02T00:00
+
+Companies default to every row of the companies table; pass --company
+'Apple=en Apple_Inc.' (repeatable) to backfill others.
+"""
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from scripts.download_pageviews import BASE_URL, download_many
+from scripts.extract_pageviews import ExtractPageViews
+from scripts.load_pageviews import LoadPageViews
+from scripts.stream_pageviews import StreamPageViews
+
+logging.basicConfig(level=logging.INFO)
+
+
+def _extract_gz(gz_path, companies):
+    """
+    Process pool worker: filter one cached dump. Runs in its own process
+    so the line scans do not share a GIL.
+    """
+    if gz_path is None:
+        return None
+    return ExtractPageViews(gz_path, companies).extract()
+
+
+def _stream_hour(hour_ts, companies, base_url):
+    """
+    Process pool worker: stream and filter the dump for one hour without
+    keeping it on disk.
+    """
+    streamer = StreamPageViews(day=hour_ts.day, hour=hour_ts.hour, companies=companies,
+                               year=hour_ts.year, month=hour_ts.month, base_url=base_url)
+    return streamer.run()
+
+
+class BackfillPageViews:
+    """
+    Downloads, extracts and loads every hour in [start, end).
+    Hours are processed in batches: each batch is fetched with at most
+    max_workers concurrent downloads and loaded in one transaction.
+    With use_cache the batch is downloaded into the local cache by a thread
+    pool first, so a re-run scans hours it already has without touching
+    the network, and the scans then run in the process pool.
+    """
+
+    def __init__(self, start: datetime, end: datetime, companies: dict,
+                 max_workers=4, batch_size=24, base_url=BASE_URL, use_cache=True):
+        # Dumps are stamped in UTC; hours are walked as naive UTC datetimes
+        start, end = (ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo else ts
+                      for ts in (start, end))
+
+        self.start = start.replace(minute=0, second=0, microsecond=0)
+        self.end = end
+        if self.end <= self.start:
+            raise ValueError(f"Backfill end {end} must be after start {start}.")
+
+        self.companies = companies
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.base_url = base_url
+        self.use_cache = use_cache
+
+    def hours(self):
+        """
+        Every hour timestamp from start (inclusive) to end (exclusive).
+        """
+        hour_ts = self.start
+        while hour_ts < self.end:
+            yield hour_ts
+            hour_ts += timedelta(hours=1)
+
+    def batches(self):
+        batch = []
+        for hour_ts in self.hours():
+            batch.append(hour_ts)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def run(self):
+        """
+        Returns (hours loaded, hours missing).
+        """
+        loader = LoadPageViews()
+        loader.setup_database()
+
+        loaded, missing = 0, []
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            for batch in self.batches():
+                logging.info(f"Backfilling {batch[0]} to {batch[-1]}")
+
+                if self.use_cache:
+                    gz_paths = download_many(batch, max_workers=self.max_workers, base_url=self.base_url)
+                    results = pool.map(_extract_gz, [gz_paths[hour_ts] for hour_ts in batch],
+                                       [self.companies] * len(batch))
+                else:
+                    results = pool.map(_stream_hour, batch,
+                                       [self.companies] * len(batch),
+                                       [self.base_url] * len(batch))
+
+                to_load = []
+                for hour_ts, companies_pageviews in zip(batch, results):
+                    if companies_pageviews is None:
+                        missing.append(hour_ts)
+                        continue
+                    to_load.append((hour_ts.replace(tzinfo=timezone.utc), companies_pageviews))
+
+                if to_load:
+                    loader.load_batch(to_load)
+                    loaded += len(to_load)
+
+        if missing:
+            logging.warning(f"{len(missing)} hours could not be fetched: {[str(ts) for ts in missing]}")
+
+        logging.info(f"✅ Backfill complete. Loaded {loaded} hours.")
+        return loaded, missing
+
+
+def companies_from_table():
+    """
+    {company_name: 'domain_code page_title'} for every row of the companies table.
+    """
+    from sqlalchemy import text
+
+    loader = LoadPageViews()
+    loader.setup_database()
+    with loader.engine.connect() as conn:
+        rows = conn.execute(text("SELECT company_name, domain_code, page_title FROM companies;")).fetchall()
+    return {company_name: f"{domain_code} {page_title}" for company_name, domain_code, page_title in rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill pageview hours in [start, end).")
+    parser.add_argument("--start", type=datetime.fromisoformat, required=True,
+                        help="first hour, ISO datetime in UTC")
+    parser.add_argument("--end", type=datetime.fromisoformat, required=True,
+                        help="end of the range (exclusive), ISO datetime in UTC")
+    parser.add_argument("--company", action="append", default=[], metavar="NAME=DOMAIN TITLE",
+                        help="e.g. 'Apple=en Apple_Inc.'; defaults to the companies table")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=24)
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--no-cache", action="store_true",
+                        help="stream each hour instead of going through the download cache")
+    args = parser.parse_args()
+
+    companies = dict(company.split("=", 1) for company in args.company) or companies_from_table()
+    if not companies:
+        parser.error("No companies to backfill: pass --company or fill the companies table first.")
+
+    backfill = BackfillPageViews(args.start, args.end, companies, max_workers=args.workers,
+                                 batch_size=args.batch_size, base_url=args.base_url,
+                                 use_cache=not args.no_cache)
+    _, missing = backfill.run()
+    return 1 if missing else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,6 @@
+import os
+from pathlib import Path
+
+# Shared data volume: download cache, extracted dumps, handoff files and the
+# Parquet dataset all live under it, so any worker can read what another wrote
+DATA_DIR = Path(os.getenv("WIKIPEDIA_DATA_DIR", "/opt/airflow/data"))
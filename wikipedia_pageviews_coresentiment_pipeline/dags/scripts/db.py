@@ -0,0 +1,280 @@
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine, text
+
+logging.basicConfig(level=logging.INFO)
+
+# postgres DB connection details, overridable from the environment
+DB_HOST = os.getenv("WIKIPEDIA_DB_HOST", "postgres")
+DB_PORT = os.getenv("WIKIPEDIA_DB_PORT", "5432")
+DB_USER = os.getenv("WIKIPEDIA_DB_USER", "airflow")
+DB_PASSWORD = os.getenv("WIKIPEDIA_DB_PASSWORD", "airflow")
+DB_NAME = os.getenv("WIKIPEDIA_DB_NAME", "wikipedia")
+
+# Pool sizing per process
+DB_POOL_SIZE = int(os.getenv("WIKIPEDIA_DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("WIKIPEDIA_DB_MAX_OVERFLOW", "5"))
+DB_POOL_RECYCLE = int(os.getenv("WIKIPEDIA_DB_POOL_RECYCLE", "1800"))
+
+# Each entry upgrades the schema by one version. Version 1 is the DDL that
+# setup_database ran before every load; with IF NOT EXISTS an Airflow database
+# that already has companies and the day/hour table is stamped version 1 and
+# migrated from there.
+MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS companies (
+        id SERIAL PRIMARY KEY,
+        company_name TEXT NOT NULL,
+        domain_code TEXT NOT NULL,
+        page_title TEXT NOT NULL,
+        created_at TIMESTAMPTZ DEFAULT NOW(),
+        UNIQUE(page_title)
+    );
+
+    CREATE TABLE IF NOT EXISTS pageviews_hourly (
+        id SERIAL PRIMARY KEY,
+        company_id INTEGER NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+        day INTEGER NOT NULL,
+        hour INTEGER NOT NULL,
+        view_count INTEGER NOT NULL,
+        response_size BIGINT NOT NULL,
+        created_at TIMESTAMPTZ DEFAULT NOW(),
+        UNIQUE(day, hour, company_id)
+    );
+    """,
+    # 2: pageviews_hourly keyed on a real UTC timestamp and range-partitioned
+    # by month. Rows from the day/hour table can only have come from October
+    # 2025, the one month the old pipeline could download.
+    """
+    ALTER TABLE pageviews_hourly RENAME TO pageviews_hourly_v1;
+    ALTER INDEX pageviews_hourly_pkey RENAME TO pageviews_hourly_v1_pkey;
+    ALTER TABLE pageviews_hourly_v1
+        RENAME CONSTRAINT pageviews_hourly_day_hour_company_id_key TO pageviews_hourly_v1_day_hour_company_id_key;
+
+    CREATE TABLE pageviews_hourly (
+        company_id INTEGER NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+        hour_ts TIMESTAMPTZ NOT NULL,
+        view_count INTEGER NOT NULL,
+        response_size BIGINT NOT NULL,
+        created_at TIMESTAMPTZ DEFAULT NOW(),
+        PRIMARY KEY (hour_ts, company_id)
+    ) PARTITION BY RANGE (hour_ts);
+
+    -- "top companies in a window": index-only range scan per partition
+    CREATE INDEX pageviews_hourly_window_idx
+        ON pageviews_hourly (hour_ts) INCLUDE (company_id, view_count);
+    -- one company's series over time
+    CREATE INDEX pageviews_hourly_company_idx
+        ON pageviews_hourly (company_id, hour_ts) INCLUDE (view_count);
+
+    CREATE TABLE pageviews_hourly_y2025m10 PARTITION OF pageviews_hourly
+        FOR VALUES FROM ('2025-10-01 00:00:00+00') TO ('2025-11-01 00:00:00+00');
+
+    INSERT INTO pageviews_hourly (company_id, hour_ts, view_count, response_size, created_at)
+    SELECT company_id, make_timestamptz(2025, 10, day, hour, 0, 0, 'UTC'), view_count, response_size, created_at
+    FROM pageviews_hourly_v1;
+
+    DROP TABLE pageviews_hourly_v1;
+    """,
+    # 3: daily and weekly rollups, maintained incrementally by the analyse task
+    """
+    CREATE TABLE pageviews_daily (
+        company_id INTEGER NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+        day DATE NOT NULL,
+        view_count BIGINT NOT NULL,
+        hours_loaded SMALLINT NOT NULL,
+        updated_at TIMESTAMPTZ DEFAULT NOW(),
+        PRIMARY KEY (day, company_id)
+    );
+    CREATE INDEX pageviews_daily_company_idx ON pageviews_daily (company_id, day) INCLUDE (view_count);
+
+    CREATE TABLE pageviews_weekly (
+        company_id INTEGER NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+        week_start DATE NOT NULL,
+        view_count BIGINT NOT NULL,
+        hours_loaded SMALLINT NOT NULL,
+        updated_at TIMESTAMPTZ DEFAULT NOW(),
+        PRIMARY KEY (week_start, company_id)
+    );
+    CREATE INDEX pageviews_weekly_company_idx ON pageviews_weekly (company_id, week_start) INCLUDE (view_count);
+
+    INSERT INTO pageviews_daily (company_id, day, view_count, hours_loaded)
+    SELECT company_id, (hour_ts AT TIME ZONE 'UTC')::date, SUM(view_count), COUNT(*)
+    FROM pageviews_hourly
+    GROUP BY 1, 2;
+
+    INSERT INTO pageviews_weekly (company_id, week_start, view_count, hours_loaded)
+    SELECT company_id, date_trunc('week', day)::date, SUM(view_count), SUM(hours_loaded)
+    FROM pageviews_daily
+    GROUP BY 1, 2;
+    """,
+    # 4: per company, per hour signals written by SentimentSignals
+    """
+    CREATE TABLE company_sentiment_signals (
+        company_id INTEGER NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+        hour_ts TIMESTAMPTZ NOT NULL,
+        view_count BIGINT NOT NULL,
+        view_delta BIGINT,
+        pct_change DOUBLE PRECISION,
+        zscore DOUBLE PRECISION,
+        attention_share DOUBLE PRECISION,
+        computed_at TIMESTAMPTZ DEFAULT NOW(),
+        PRIMARY KEY (hour_ts, company_id)
+    );
+    CREATE INDEX company_sentiment_signals_company_idx
+        ON company_sentiment_signals (company_id, hour_ts) INCLUDE (zscore, attention_share);
+    """,
+    # 5: per stage timings and throughput recorded by StageMetrics
+    """
+    CREATE TABLE pipeline_metrics (
+        id BIGSERIAL PRIMARY KEY,
+        stage TEXT NOT NULL,
+        hour_ts TIMESTAMPTZ,
+        started_at TIMESTAMPTZ NOT NULL,
+        wall_seconds DOUBLE PRECISION NOT NULL,
+        bytes BIGINT NOT NULL DEFAULT 0,
+        lines BIGINT NOT NULL DEFAULT 0,
+        rows BIGINT NOT NULL DEFAULT 0,
+        bytes_per_sec DOUBLE PRECISION GENERATED ALWAYS AS (bytes / NULLIF(wall_seconds, 0)) STORED,
+        lines_per_sec DOUBLE PRECISION GENERATED ALWAYS AS (lines / NULLIF(wall_seconds, 0)) STORED,
+        peak_rss_kb BIGINT,
+        status TEXT NOT NULL,
+        host TEXT,
+        pid INTEGER,
+        detail JSONB
+    );
+    CREATE INDEX pipeline_metrics_stage_idx ON pipeline_metrics (stage, started_at);
+    """,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+_engine = None
+_schema_ready = False
+_partitions = set()
+_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    """
+    A forked child (e.g. a ProcessPoolExecutor worker) must not reuse the
+    parent's pooled connections. Drop them without closing the parent's
+    sockets, so the child opens its own pool on first use.
+    """
+    global _engine, _schema_ready, _lock
+
+    if _engine is not None:
+        _engine.dispose(close=False)
+    _engine = None
+    _schema_ready = False
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def database_url():
+    return f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+
+def get_engine():
+    """
+    Return the process-wide pooled engine, creating it on first use.
+    pool_pre_ping replaces connections the server dropped between tasks.
+    """
+    global _engine
+
+    with _lock:
+        if _engine is None:
+            _engine = create_engine(
+                database_url(),
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_recycle=DB_POOL_RECYCLE,
+                pool_pre_ping=True,
+            )
+        return _engine
+
+
+def _current_version(conn):
+    if conn.execute(text("SELECT to_regclass('schema_version');")).scalar() is None:
+        return 0
+    return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version;")).scalar()
+
+
+def ensure_schema(engine=None):
+    """
+    Bring the schema up to SCHEMA_VERSION, at most once per process.
+    An up-to-date database costs a single version check; migrations run
+    under an advisory lock so concurrent workers apply each one only once.
+    """
+    global _schema_ready
+
+    if _schema_ready:
+        return
+
+    engine = engine or get_engine()
+
+    with _lock:
+        if _schema_ready:
+            return
+
+        with engine.connect() as conn:
+            version = _current_version(conn)
+
+        if version < SCHEMA_VERSION:
+            with engine.begin() as conn:
+                conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('wikipedia_schema'));"))
+                conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    applied_at TIMESTAMPTZ DEFAULT NOW()
+                );
+                """))
+
+                # Re-read under the lock: another worker may have migrated already
+                version = _current_version(conn)
+                for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                    logging.info(f"Applying schema migration {number}")
+                    conn.execute(text(migration))
+                    conn.execute(text("INSERT INTO schema_version (version) VALUES (:version);"),
+                                 {'version': number})
+
+        _schema_ready = True
+
+
+def ensure_partitions(conn, timestamps):
+    """
+    Create the monthly pageviews_hourly partitions covering the given
+    timezone-aware timestamps, on the caller's open transaction.
+    Months already seen by this process are skipped without a round trip.
+    """
+    months = {(ts.astimezone(timezone.utc).year, ts.astimezone(timezone.utc).month) for ts in timestamps}
+    missing = sorted(months - _partitions)
+    if not missing:
+        return
+
+    # Serialise with other workers creating the same partition
+    conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('pageviews_hourly_partitions'));"))
+
+    for year, month in missing:
+        start = datetime(year, month, 1, tzinfo=timezone.utc)
+        end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+        conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS pageviews_hourly_y{year}m{month:02d} PARTITION OF pageviews_hourly
+            FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}');
+        """))
+
+    # If the caller's transaction rolls back it must call forget_partitions
+    _partitions.update(missing)
+
+
+def forget_partitions():
+    """
+    Drop the remembered partitions, e.g. after a rolled-back load.
+    """
+    _partitions.clear()
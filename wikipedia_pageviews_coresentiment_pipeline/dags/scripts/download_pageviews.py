@@ -2,27 +2,82 @@ import os
 import logging
 import requests
 import gzip
+import hashlib
+import shutil
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+from scripts.config import DATA_DIR
+from scripts.metrics import StageMetrics
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 
+BASE_URL = "https://dumps.wikimedia.org/other/pageviews/"
+
+# HTTP chunk size for the streaming download
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Cached and extracted dumps downloaded longer ago than this are deleted by
+# the next download (an hour of dumps is ~70 MB compressed); 0 keeps them all.
+# Re-running an older hour then fetches its dump again.
+DOWNLOAD_RETENTION_DAYS = float(os.getenv("WIKIPEDIA_DOWNLOAD_RETENTION_DAYS", "7"))
+
+
+def prune_downloads(*dirs, retention_days=DOWNLOAD_RETENTION_DAYS):
+    """
+    Delete files in dirs not modified for retention_days: cached .gz dumps
+    with their .md5 files, abandoned .part files and extracted dumps.
+    .lock files are empty and kept, so a fetch holding one is never raced.
+    """
+    if retention_days <= 0:
+        return
+
+    cutoff = time.time() - retention_days * 86400
+    removed = 0
+
+    for directory in dirs:
+        for path in Path(directory).iterdir():
+            try:
+                if path.suffix != ".lock" and path.is_file() and path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass  # pruned concurrently by another task
+
+    if removed:
+        logging.info(f"Removed {removed} expired files from the download cache")
+
+
 class DownloadPageViews:
     """
     Handles downloading and extracting Wikipedia pageview files.
     """
 
-    def __init__(self, day, hour):
+    def __init__(self, day, hour, year=2025, month=10, base_url=BASE_URL, data_dir=DATA_DIR):
         """
-        Initialize with day and hour provided by the user.
+        Initialize with the date and hour provided by the user.
+        base_url is the root of the dump tree ({year}/{year}-{month}/ is
+        appended) and can point at a local HTTP server serving a fixture dump.
         """
-        self.base_url = "https://dumps.wikimedia.org/other/pageviews/2025/2025-10/"
-        self.download_dir = Path("/opt/airflow/data/downloads")
-        self.extract_dir = Path("/opt/airflow/data/extracted")
+        self.year = year
+        self.month = month
+        self.base_url = f"{base_url}{year}/{year}-{str(month).zfill(2)}/"
+        self.download_dir = Path(data_dir) / "downloads"
+        self.extract_dir = Path(data_dir) / "extracted"
 
         self.day = day
         self.hour = hour
+        self.hour_ts = datetime(year, month, day, hour, tzinfo=timezone.utc)
 
         # Make sure directories exist
         self.download_dir.mkdir(parents=True, exist_ok=True)
@@ -68,14 +123,16 @@ class DownloadPageViews:
 
         self.day = day
         self.hour = hour
+        self.hour_ts = datetime(self.year, self.month, day, hour, tzinfo=timezone.utc)
 
     def __construct_pageview_filename(self) -> str:
         """
-        Build the Wikipedia pageview filename based on day and hour.
+        Build the Wikipedia pageview filename based on the date and hour.
         """
+        month_str = str(self.month).zfill(2)
         day_str = str(self.day).zfill(2)
         hour_str = str(self.hour).zfill(2)
-        return f"pageviews-202510{day_str}-{hour_str}0000"
+        return f"pageviews-{self.year}{month_str}{day_str}-{hour_str}0000"
 
     def __construct_download_link(self) -> str:
         """
@@ -83,56 +140,241 @@ class DownloadPageViews:
         """
         return f"{self.base_url}{self.pageview_filename}.gz"
 
-    def download_file(self) -> Path:
+    @staticmethod
+    def _md5(path) -> str:
+        digest = hashlib.md5()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(STREAM_CHUNK_SIZE), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _published_md5(self):
         """
-        Downloads the pageview .gz file and extracts it.
-        Returns the path to the extracted file (no extension).
+        Look up this dump's checksum in Wikimedia's md5sums.txt for the month.
+        Returns None if the checksum list cannot be fetched or has no entry yet.
         """
+        try:
+            response = requests.get(f"{self.base_url}md5sums.txt", timeout=30)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logging.warning(f"Could not fetch md5sums.txt, skipping checksum validation: {e}")
+            return None
+
+        for line in response.text.splitlines():
+            parts = line.split()
+            if len(parts) == 2 and parts[1] == f"{self.pageview_filename}.gz":
+                return parts[0]
+        return None
+
+    @staticmethod
+    def _write_checksum(download_path, checksum_path, checksum):
+        """
+        Record the verified md5 with the file's size and mtime, so later
+        cache hits can trust an unchanged file without hashing it again.
+        """
+        stat = download_path.stat()
+        checksum_path.write_text(f"{checksum} {stat.st_size} {stat.st_mtime_ns}")
+
+    def _cached_gz(self, download_path, checksum_path):
+        """
+        A cached .gz is reused only if it still matches the checksum recorded
+        when it was downloaded; this needs no network access. A file whose
+        size and mtime are as recorded is not hashed again.
+        """
+        if not (download_path.exists() and checksum_path.exists()):
+            return False
+
+        # "md5 size mtime_ns"; files cached before the stat was recorded hold only the md5
+        checksum, *recorded = checksum_path.read_text().split() or [""]
+        stat = download_path.stat()
+        if recorded == [str(stat.st_size), str(stat.st_mtime_ns)]:
+            return True
+
+        if self._md5(download_path) == checksum:
+            self._write_checksum(download_path, checksum_path, checksum)
+            return True
+
+        logging.warning(f"Cached {download_path} is corrupt, downloading again.")
+        download_path.unlink(missing_ok=True)
+        checksum_path.unlink(missing_ok=True)
+        return False
+
+    def fetch_gz(self) -> Path:
+        """
+        Return the path of the .gz dump in the local download cache, fetching
+        it only if it is not cached yet.
+        A partial download left by an earlier attempt is resumed with an HTTP
+        Range request, and the finished file is validated against its size
+        and Wikimedia's published md5 before it enters the cache.
+        Returns None if the file could not be fetched.
+        """
+        prune_downloads(self.download_dir, self.extract_dir)
+
+        with StageMetrics("download", hour_ts=self.hour_ts, url=self.download_url) as stage, \
+                self._fetch_lock():
+            download_path = self._fetch_gz(stage)
+            if download_path is None:
+                stage.status = "failed"
+            return download_path
+
+    @contextmanager
+    def _fetch_lock(self):
+        """
+        Hold an exclusive lock on this dump while it is fetched. Tasks for
+        the same hour, on any worker sharing the data volume, then take turns
+        on its .part file instead of appending to it at once; the later ones
+        find the finished dump in the cache.
+        """
+        with open(self.download_dir / f"{self.pageview_filename}.gz.lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield  # closing the file releases the lock
+
+    def _fetch_gz(self, stage) -> Path:
         download_path = self.download_dir / f"{self.pageview_filename}.gz"
-        extract_path = self.extract_dir / self.pageview_filename  # no extension
+        partial_path = self.download_dir / f"{self.pageview_filename}.gz.part"
+        checksum_path = self.download_dir / f"{self.pageview_filename}.gz.md5"
+
+        if self._cached_gz(download_path, checksum_path):
+            stage.detail['cached'] = True
+            logging.info(f"✅ Using cached download: {download_path}")
+            return download_path
+
+        offset = partial_path.stat().st_size if partial_path.exists() else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
 
-        logging.info(f"Downloading: {self.download_url}")
+        logging.info(f"Downloading: {self.download_url}" + (f" (resuming at byte {offset})" if offset else ""))
 
         try:
-            response = requests.get(self.download_url, stream=True, timeout=30)
-            response.raise_for_status()
-            
+            response = requests.get(self.download_url, headers=headers, stream=True, timeout=30)
+
+            # The partial file already holds the whole dump
+            if response.status_code == 416:
+                response.close()
+                expected_size = offset
+            else:
+                response.raise_for_status()
+
+                # A 200 means the server ignored the Range header: start over
+                mode = "ab" if response.status_code == 206 else "wb"
+                if mode == "wb":
+                    offset = 0
+                content_length = response.headers.get("Content-Length")
+                expected_size = offset + int(content_length) if content_length else None
+
+                with response, open(partial_path, mode) as f:
+                    for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                        f.write(chunk)
+                        stage.bytes += len(chunk)
+
         except requests.exceptions.HTTPError as e:
             if response.status_code == 404:
-                logging.error(f"Pageview file not available yet for Oct {self.day}, hour {self.hour}. "
+                logging.error(f"Pageview file not available yet for {self.year}-{self.month}-{self.day}, hour {self.hour}. "
                             "Try again later.")
             else:
                 logging.error(f"❌ HTTP error while fetching file: {e}")
             return None  # stop execution gracefully
 
         except requests.exceptions.RequestException as e:
+            # Keep the .part file so the next attempt can resume it
             logging.error(f"Network error while fetching file: {e}")
             return None
 
-        # Save .gz file
-        with open(download_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+        actual_size = partial_path.stat().st_size
+        if expected_size and actual_size != expected_size:
+            logging.error(f"❌ Incomplete download: got {actual_size} of {expected_size} bytes.")
+            return None
+
+        checksum = self._md5(partial_path)
+        expected_checksum = self._published_md5()
+        if expected_checksum and checksum != expected_checksum:
+            logging.error(f"❌ Checksum mismatch for {self.pageview_filename}.gz, discarding download.")
+            partial_path.unlink(missing_ok=True)
+            return None
+
+        partial_path.replace(download_path)
+        self._write_checksum(download_path, checksum_path, checksum)
 
         logging.info(f"✅ Downloaded to: {download_path}")
+        return download_path
 
-        # Extract the .gz file (without extension)
-        try:
-            with gzip.open(download_path, "rb") as gz_file:
-                with open(extract_path, "wb") as out_file:
-                    out_file.write(gz_file.read())
+    def download_file(self, decompress=True) -> Path:
+        """
+        Fetches the pageview .gz file (from the cache when possible) and, by
+        default, extracts it.
+        Returns the path to the extracted file (no extension), or the path
+        to the .gz file itself when decompress is False so the extract step
+        can scan the compressed stream directly.
+        """
+        extract_path = self.extract_dir / self.pageview_filename  # no extension
 
-            logging.info(f"📂 Extracted to: {extract_path}")
+        download_path = self.fetch_gz()
+        if download_path is None:
+            return None
 
-            # Optional cleanup (remove .gz)
-            download_path.unlink(missing_ok=True)
+        if not decompress:
+            return download_path
 
+        # Extract the .gz file (without extension), chunk by chunk.
+        # The .gz stays in the download cache for re-runs.
+        try:
+            with StageMetrics("decompress", hour_ts=self.hour_ts) as stage, \
+                    gzip.open(download_path, "rb") as gz_file, open(extract_path, "wb") as out_file:
+                shutil.copyfileobj(gz_file, out_file, length=STREAM_CHUNK_SIZE)
+                stage.bytes = out_file.tell()
+
+            logging.info(f"📂 Extracted to: {extract_path}")
             return extract_path
         
         except Exception as e:
             logging.error(f"❌ Error extracting .gz file: {e}")
             return None
 
+    def iter_lines(self):
+        """
+        Stream the .gz dump over HTTP and yield raw lines (bytes) as the
+        chunks arrive, without writing anything to disk.
+        Raises requests exceptions on HTTP or network errors.
+        """
+        logging.info(f"Streaming: {self.download_url}")
+
+        with StageMetrics("stream", hour_ts=self.hour_ts, url=self.download_url) as stage, \
+                requests.get(self.download_url, stream=True, timeout=30) as response:
+            response.raise_for_status()
+
+            # 16 + MAX_WBITS tells zlib to expect a gzip header
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            pending = b""
+
+            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                stage.bytes += len(chunk)
+                pending += decompressor.decompress(chunk)
+                *lines, pending = pending.split(b"\n")
+                stage.lines += len(lines)
+                yield from lines
+
+            pending += decompressor.flush()
+            for line in pending.split(b"\n"):
+                if line:
+                    stage.lines += 1
+                    yield line
+
+        logging.info(f"✅ Finished streaming: {self.download_url}")
+
+
+def download_many(hours, max_workers=4, base_url=BASE_URL):
+    """
+    Fetch the dumps for many hours into the download cache with a thread pool.
+    Returns {hour_ts: path to the cached .gz, or None if it could not be fetched}.
+    """
+    def fetch(hour_ts):
+        return DownloadPageViews(day=hour_ts.day, hour=hour_ts.hour, year=hour_ts.year,
+                                 month=hour_ts.month, base_url=base_url).fetch_gz()
+
+    hours = list(hours)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return dict(zip(hours, pool.map(fetch, hours)))
+
 
 def download_task_callable(**context):
     """
@@ -144,18 +386,24 @@ def download_task_callable(**context):
     params = context["params"]
     day = params.get("day")
     hour = params.get("hour")
+    year = int(params.get("year", 2025))
+    month = int(params.get("month", 10))
+
+    # scan the .gz directly in the extract task instead of writing the
+    # uncompressed dump to disk
+    decompress = not params.get("stream_gzip", True)
 
     if day is None or hour is None:
         logging.error("DAG was triggered without 'day' or 'hour' parameters.")
         raise ValueError("Missing 'day' or 'hour' in DAG run configuration.")
 
-    logging.info(f"Starting download for Oct {day}, hour {hour}")
+    logging.info(f"Starting download for {year}-{month}-{day}, hour {hour}")
     
     # Instantiate the class with the parameters
-    downloader = DownloadPageViews(day=int(day), hour=int(hour))
+    downloader = DownloadPageViews(day=int(day), hour=int(hour), year=year, month=month)
     
     # Run the download
-    extracted_file_path = downloader.download_file()
+    extracted_file_path = downloader.download_file(decompress=decompress)
     
     # store the extracted file path in xcom
     if extracted_file_path:
@@ -1,46 +1,265 @@
+import gzip
+import io
 import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+from scripts.handoff import write_handoff
+from scripts.metrics import StageMetrics
+
 logging.basicConfig(level=logging.INFO)
 
+# Read size for the compressed stream; memory stays bounded by this,
+# not by the size of the hourly dump.
+GZIP_READ_CHUNK = 1024 * 1024
+
+
+def _open_dump(path):
+    """
+    Open a pageview file for line-by-line reading in binary mode.
+    A .gz dump is decompressed chunk by chunk while it is scanned, so no
+    uncompressed copy is ever written to disk.
+    """
+    if path.suffix == ".gz":
+        raw = gzip.open(path, "rb")
+        return io.BufferedReader(raw, buffer_size=GZIP_READ_CHUNK)
+    return open(path, "rb")
+
+
 class ExtractPageViews:
     def __init__(self, extracted_path, companies : dict):
-        self.extracted_path = Path(extracted_path)
+        # extracted_path may be None when lines are fed in via extract_lines
+        self.extracted_path = Path(extracted_path) if extracted_path else None
         self.companies = companies
+        self.lines_scanned = 0
+
+    def _open(self):
+        return _open_dump(self.extracted_path)
+
+    def _build_matcher(self):
+        """
+        Encode the configured titles once so lines can be matched as raw bytes.
+        Returns (targets, prefixes): targets maps b"en Apple_Inc." to the
+        company name, prefixes holds the domain codes (with their trailing
+        space) that any target can start with.
+        """
+        targets = {title.encode("utf-8"): company for company, title in self.companies.items()}
+        prefixes = tuple({target.split(b" ", 1)[0] + b" " for target in targets})
+        return targets, prefixes
+
+    def extract_lines(self, lines):
+        """
+        Filter an iterable of raw pageview lines (bytes) down to the configured
+        companies. Works on any line source: an open file or a live download
+        stream.
+
+        Most lines are rejected on their domain code prefix alone, the rest on
+        a single dict lookup of the "domain title" slice; a line is only
+        decoded and split once it is known to match.
+        """
+        targets, prefixes = self._build_matcher()
+        results = {company: 0 for company in self.companies}
+        self.lines_scanned = scanned = 0
+
+        if not targets:
+            return results
+
+        for scanned, line in enumerate(lines, 1):
+            if not line.startswith(prefixes):
+                continue
+
+            # End of "domain_code page_title" is the second space
+            title_end = line.find(b" ", line.find(b" ") + 1)
+            if title_end < 0:
+                continue
+
+            company = targets.get(line[:title_end])
+            if company is None:
+                continue
+
+            parts = line.decode("utf-8", errors="replace").strip().split(" ")
+
+            # Skip malformed lines
+            if len(parts) < 4:
+                continue
+
+            results[company] = {'domain_code': parts[0],
+                                'page_title': parts[1],
+                                'views' : parts[2],
+                                'resp_size': parts[3]
+                                }
+
+        self.lines_scanned = scanned
+        return results
 
     def extract(self):
         logging.info(f"Extracting company pageviews from: {self.extracted_path}")
 
-        # Reverse the mapping for easier lookup (page title → company name)
-        page_titles = {v: k for k, v in self.companies.items()}
+        try:
+            with StageMetrics("scan", path=str(self.extracted_path)) as stage, self._open() as f:
+                results = self.extract_lines(f)
+                # Uncompressed bytes, also for a .gz dump
+                stage.bytes = f.tell()
+                stage.lines = self.lines_scanned
+                stage.rows = sum(1 for row in results.values() if row)
+
+            logging.info(f"✅ Extracted pageviews")
+            return results
+
+        except FileNotFoundError:
+            logging.error(f"Extracted file not found: {self.extracted_path}")
+            return None
+
+    def _split_ranges(self, shards):
+        """
+        Split the file into `shards` byte ranges whose edges fall on line
+        boundaries, so no line is cut between two workers.
+        """
+        size = self.extracted_path.stat().st_size
+        boundaries = [0]
+
+        with open(self.extracted_path, "rb") as f:
+            for i in range(1, shards):
+                # Step back one byte so a cut landing exactly on a line start keeps it
+                f.seek(max(size * i // shards - 1, boundaries[-1]))
+                f.readline()
+                boundaries.append(min(f.tell(), size))
+
+        boundaries.append(size)
+        return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end]
+
+    def extract_parallel(self, workers=None):
+        """
+        Scan an uncompressed dump in a process pool, one line-aligned byte
+        range per worker, then merge the per-company results.
+        A .gz dump cannot be split, so it falls back to the single-core scan.
+        """
+        workers = workers or os.cpu_count() or 1
+
+        if workers <= 1 or self.extracted_path.suffix == ".gz":
+            return self.extract()
+
+        logging.info(f"Extracting company pageviews from: {self.extracted_path} with {workers} workers")
+
+        try:
+            ranges = self._split_ranges(workers)
+        except FileNotFoundError:
+            logging.error(f"Extracted file not found: {self.extracted_path}")
+            return None
+
+        # An empty dump has nothing to split; the single-core scan handles it
+        if not ranges:
+            return self.extract()
+
         results = {company: 0 for company in self.companies}
 
+        with StageMetrics("scan", path=str(self.extracted_path), workers=workers) as stage, \
+                ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_scan_range, str(self.extracted_path), start, end, self.companies)
+                       for start, end in ranges]
+
+            # Ranges are merged in file order so a later match wins, as in extract()
+            for future in futures:
+                lines, range_results = future.result()
+                stage.lines += lines
+                for company, row in range_results.items():
+                    if row:
+                        results[company] = row
+
+            stage.bytes = ranges[-1][1]
+            stage.rows = sum(1 for row in results.values() if row)
+
+        logging.info("✅ Extracted pageviews")
+        return results
+
+
+class ExtractWatchlistPageViews:
+    """
+    Aggregates views for a large watchlist of page titles in one pass.
+    Unlike ExtractPageViews, every domain code (en, en.m, de, ...) is kept
+    unless domain_codes narrows it down, and repeated rows are summed.
+    Each line costs one set lookup whatever the size of the watchlist.
+    """
+
+    def __init__(self, extracted_path, titles, domain_codes=None):
+        self.extracted_path = Path(extracted_path) if extracted_path else None
+        self.titles = {title.encode("utf-8") for title in titles}
+        self.domain_codes = {code.encode("utf-8") for code in domain_codes} if domain_codes else None
+        self.lines_scanned = 0
+
+    @classmethod
+    def from_companies_table(cls, extracted_path, engine, domain_codes=None):
+        """
+        Build the watchlist from every page title in the companies table.
+        """
+        from sqlalchemy import text
+
+        with engine.connect() as conn:
+            titles = conn.execute(text("SELECT DISTINCT page_title FROM companies;")).scalars().all()
+
+        logging.info(f"Loaded watchlist of {len(titles)} titles from the companies table")
+        return cls(extracted_path, titles, domain_codes)
+
+    def extract_lines(self, lines):
+        """
+        Returns {page_title: {domain_code: {'views': int, 'resp_size': int}}}
+        for every watched title seen in the lines.
+        """
+        titles = self.titles
+        domain_codes = self.domain_codes
+        totals = {}
+        scanned = 0
+
+        for scanned, line in enumerate(lines, 1):
+            domain_end = line.find(b" ")
+            title_end = line.find(b" ", domain_end + 1)
+            if domain_end < 0 or title_end < 0:
+                continue
+
+            title = line[domain_end + 1:title_end]
+            if title not in titles:
+                continue
+
+            domain = line[:domain_end]
+            if domain_codes is not None and domain not in domain_codes:
+                continue
+
+            counts = line[title_end + 1:].split()
+            try:
+                views = int(counts[0])
+                resp_size = int(counts[1]) if len(counts) > 1 else 0
+            except (IndexError, ValueError):
+                continue
+
+            key = (domain, title)
+            if key in totals:
+                totals[key][0] += views
+                totals[key][1] += resp_size
+            else:
+                totals[key] = [views, resp_size]
+
+        self.lines_scanned = scanned
+        results = {}
+        for (domain, title), (views, resp_size) in totals.items():
+            page_title = title.decode("utf-8", errors="replace")
+            domain_code = domain.decode("utf-8", errors="replace")
+            results.setdefault(page_title, {})[domain_code] = {'views': views, 'resp_size': resp_size}
+
+        return results
+
+    def extract(self):
+        logging.info(f"Extracting watchlist pageviews ({len(self.titles)} titles) from: {self.extracted_path}")
+
         try:
-            with open(self.extracted_path, "r", encoding="utf-8") as f:
-                for line in f:
-                    parts = line.strip().split(" ")
-
-                    # Skip malformed lines
-                    if len(parts) < 4:
-                        continue
-
-                    domain_code, page_title, view_count, response_size = parts[0], parts[1], parts[2], parts[3]
-
-                    # Combine first two fields for comparison (e.g., "en Apple_Inc.")
-                    full_title = f"{domain_code} {page_title}"
-
-                    if full_title in page_titles:
-                        company = page_titles[full_title]
-                        try:
-                            results[company] = {'domain_code': domain_code, 
-                                                'page_title': page_title, 
-                                                'views' : view_count, 
-                                                'resp_size': response_size
-                                                }
-                        except ValueError:
-                            logging.warning(f"⚠️ Could not parse view count for {company}")
+            with StageMetrics("scan_watchlist", path=str(self.extracted_path)) as stage, \
+                    _open_dump(self.extracted_path) as f:
+                results = self.extract_lines(f)
+                stage.bytes = f.tell()
+                stage.lines = self.lines_scanned
+                stage.rows = sum(len(domains) for domains in results.values())
 
-            logging.info(f"✅ Extracted pageviews")
+            logging.info(f"✅ Extracted pageviews for {len(results)} watched titles")
             return results
 
         except FileNotFoundError:
@@ -48,6 +267,38 @@ class ExtractPageViews:
             return None
 
 
+def _iter_range(f, start, end):
+    """
+    Yield the lines of an open binary file between two line-aligned offsets,
+    reading it in large blocks rather than line by line.
+    """
+    f.seek(start)
+    remaining = end - start
+    pending = b""
+
+    while remaining > 0:
+        block = f.read(min(GZIP_READ_CHUNK, remaining))
+        if not block:
+            break
+        remaining -= len(block)
+        *lines, pending = (pending + block).split(b"\n")
+        yield from lines
+
+    if pending:
+        yield pending
+
+
+def _scan_range(path, start, end, companies):
+    """
+    Process pool worker: scan one byte range of the dump.
+    Returns (lines scanned, results).
+    """
+    extractor = ExtractPageViews(None, companies)
+    with open(path, "rb") as f:
+        results = extractor.extract_lines(_iter_range(f, start, end))
+    return extractor.lines_scanned, results
+
+
 def extract_task_callable(**context):
     """
     Airflow callable function for extracting pageviews.
@@ -68,24 +319,63 @@ def extract_task_callable(**context):
     # Get companies dictionary from DAG params (or use default)
     params = context["params"]
     companies_dict = params.get('companies',)
+    workers = int(params.get('extract_workers', 1))
     logging.info(f"Filtering for companies: {list(companies_dict.keys())}")
 
+    if workers > 1 and params.get('stream_gzip', True):
+        logging.warning(f"extract_workers={workers} is ignored with stream_gzip: a gzip stream cannot be "
+                        "split, so the dump is scanned in one process. Set stream_gzip to false to use them.")
+
     # Instantiate and run the extractor
     try:
         extractor = ExtractPageViews(
             extracted_path=input_file_path, 
             companies=companies_dict
         )
-        extraction_results = extractor.extract()
+        extraction_results = extractor.extract_parallel(workers=workers)
 
         if extraction_results is None:
             logging.error("❌ Extraction failed, returned None (e.g., file not found).")
             raise FileNotFoundError("Extraction process failed to find file.")
         
-        # This pushes the entire dictionary to XCom for the 'load' task
-        logging.info(f"✅ Extraction successful. Pushing results to XCom.")
-        return extraction_results
+        # Only a reference to the handoff file goes through XCom
+        logging.info("✅ Extraction successful. Handing results off to the 'load' task.")
+        return write_handoff(extraction_results, context)
 
     except Exception as e:
         logging.error(f"❌ An error occurred during extraction: {e}")
-        raise
\ No newline at end of file
+        raise
+
+
+def extract_watchlist_task_callable(**context):
+    """
+    Airflow callable for the watchlist extract.
+    Pulls the file path from the 'download' task and the watchlist from params;
+    with watchlist_from_db the titles come from the companies table instead.
+    """
+    logging.info("--- Starting Watchlist Extract Task ---")
+
+    task_instance = context['task_instance']
+    input_file_path = task_instance.xcom_pull(task_ids='download')
+
+    if not input_file_path:
+        raise ValueError("Could not get file path from upstream task.")
+
+    params = context["params"]
+    domain_codes = params.get('domain_codes')
+
+    if params.get('watchlist_from_db'):
+        from scripts.load_pageviews import LoadPageViews
+
+        loader = LoadPageViews()
+        loader.setup_database()
+        extractor = ExtractWatchlistPageViews.from_companies_table(input_file_path, loader.engine, domain_codes)
+    else:
+        extractor = ExtractWatchlistPageViews(input_file_path, params.get('watchlist', []), domain_codes)
+
+    extraction_results = extractor.extract()
+
+    if extraction_results is None:
+        raise FileNotFoundError("Extraction process failed to find file.")
+
+    return write_handoff(extraction_results, context)
@@ -0,0 +1,130 @@
+import logging
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+
+import pyarrow as pa
+
+from scripts.config import DATA_DIR
+from scripts.parquet_pageviews import SCHEMA, ParquetPageViews
+
+logging.basicConfig(level=logging.INFO)
+
+HANDOFF_ROOT = DATA_DIR / "handoff"
+
+# Run directories untouched for this long are deleted by the next handoff.
+# Downstream tasks of an older run can no longer be cleared and re-run.
+HANDOFF_RETENTION_HOURS = float(os.getenv("WIKIPEDIA_HANDOFF_RETENTION_HOURS", "48"))
+
+
+def _handoff_path(context, root=HANDOFF_ROOT) -> Path:
+    """
+    One file per task instance: {root}/{dag_id}/{run_id}/{task_id}[_{map_index}].arrow
+    """
+    task_instance = context['task_instance']
+    run_id = re.sub(r"[^A-Za-z0-9_.-]", "_", context['run_id'])
+
+    name = task_instance.task_id
+    map_index = getattr(task_instance, 'map_index', -1)
+    if map_index is not None and map_index >= 0:
+        name = f"{name}_{map_index}"
+
+    return Path(root) / task_instance.dag_id / run_id / f"{name}.arrow"
+
+
+def write_handoff(extraction_results, context, root=HANDOFF_ROOT) -> dict:
+    """
+    Write extract results to a compressed Arrow IPC file on the shared data
+    volume. Returns the small reference dict that goes through XCom instead
+    of the results themselves.
+    """
+    kind, rows = ParquetPageViews.result_rows(extraction_results)
+    table = pa.Table.from_pylist(list(rows), schema=SCHEMA.with_metadata({"kind": kind}))
+
+    prune_handoffs(root)
+
+    path = _handoff_path(context, root)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    options = pa.ipc.IpcWriteOptions(compression="zstd")
+    with pa.OSFile(str(path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+
+    logging.info(f"✅ Handed off {table.num_rows} {kind} rows via {path}")
+    return {"handoff": str(path), "kind": kind, "rows": table.num_rows}
+
+
+def remove_handoffs(refs):
+    """
+    Delete handoff files once their only consumer has loaded them, along
+    with run directories left empty.
+    """
+    for ref in refs:
+        path = Path(ref["handoff"])
+        path.unlink(missing_ok=True)
+        try:
+            path.parent.rmdir()
+        except OSError:
+            pass  # other task instances' files are still there
+
+
+def prune_handoffs(root=HANDOFF_ROOT, retention_hours=HANDOFF_RETENTION_HOURS):
+    """
+    Delete {root}/{dag_id}/{run_id} directories not written to for
+    retention_hours. Files read by more than one task (load and
+    write_parquet in the hourly DAG) are only removed this way.
+    """
+    cutoff = time.time() - retention_hours * 3600
+
+    for run_dir in Path(root).glob("*/*"):
+        try:
+            if run_dir.is_dir() and run_dir.stat().st_mtime < cutoff:
+                shutil.rmtree(run_dir, ignore_errors=True)
+                logging.info(f"Removed expired handoff files in {run_dir}")
+        except FileNotFoundError:
+            pass  # pruned concurrently by another task
+
+
+def read_handoff(ref: dict) -> dict:
+    """
+    Rebuild the extract results dict from a handoff reference.
+    The file is memory-mapped and only the columns the results need are
+    converted to Python objects (company_name is skipped for a watchlist).
+    """
+    with pa.memory_map(ref["handoff"], "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+
+    kind = table.schema.metadata.get(b"kind", b"companies").decode()
+    results = {}
+
+    if kind == "watchlist":
+        columns = table.select(["page_title", "domain_code", "views", "resp_size"]).to_pydict()
+        for page_title, domain_code, views, resp_size in zip(*columns.values()):
+            results.setdefault(page_title, {})[domain_code] = {'views': views, 'resp_size': resp_size}
+    else:
+        columns = table.select(["company_name", "domain_code", "page_title", "views", "resp_size"]).to_pydict()
+        for company_name, domain_code, page_title, views, resp_size in zip(*columns.values()):
+            results[company_name] = {'domain_code': domain_code,
+                                     'page_title': page_title,
+                                     'views': views,
+                                     'resp_size': resp_size}
+
+    return results
+
+
+def pull_results(task_instance, task_ids):
+    """
+    Pull extract results from an upstream task, following a handoff
+    reference if there is one. Plain result dicts pushed straight to XCom
+    are returned unchanged.
+    """
+    pulled = task_instance.xcom_pull(task_ids=task_ids)
+
+    if isinstance(pulled, dict) and "handoff" in pulled:
+        logging.info(f"Reading {pulled['rows']} rows from handoff file {pulled['handoff']}")
+        return read_handoff(pulled)
+
+    return pulled
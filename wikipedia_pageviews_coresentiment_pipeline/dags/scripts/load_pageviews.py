@@ -1,145 +1,207 @@
+import csv
+import io
 import logging
-import os
-from sqlalchemy import create_engine, text
+import threading
+from datetime import datetime, timezone
+from sqlalchemy import text
+
+from scripts.db import ensure_partitions, ensure_schema, forget_partitions, get_engine
+from scripts.handoff import pull_results
+from scripts.metrics import StageMetrics
+
+
+class CompanyCache:
+    """
+    Process-wide page_title -> company id cache for the companies table.
+    The whole table is read once per process; after that only titles the
+    cache has not seen cost a round trip, and they are inserted as one batch.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._ids.clear()
+            self._loaded = False
+
+    def resolve(self, conn, companies: dict) -> dict:
+        """
+        Map each page title to its company id, inserting missing companies.
+        companies maps page_title -> (company_name, domain_code).
+        """
+        with self._lock:
+            if not self._loaded:
+                self._ids.update(conn.execute(text("SELECT page_title, id FROM companies;")).fetchall())
+                self._loaded = True
+                logging.info(f"Loaded {len(self._ids)} company IDs into the cache")
+
+            missing = [title for title in companies if title not in self._ids]
+
+            if missing:
+                inserted = conn.execute(text("""
+                INSERT INTO companies (company_name, domain_code, page_title)
+                SELECT * FROM unnest(CAST(:names AS TEXT[]), CAST(:domains AS TEXT[]), CAST(:titles AS TEXT[]))
+                ON CONFLICT (page_title) DO NOTHING
+                RETURNING page_title, id;
+                """), {
+                    'names': [companies[title][0] for title in missing],
+                    'domains': [companies[title][1] for title in missing],
+                    'titles': missing,
+                }).fetchall()
+                self._ids.update(inserted)
+
+                # Titles another worker inserted since the cache was loaded
+                # hit the conflict and return nothing, so look them up.
+                raced = [title for title in missing if title not in self._ids]
+                if raced:
+                    self._ids.update(conn.execute(
+                        text("SELECT page_title, id FROM companies WHERE page_title = ANY(:titles);"),
+                        {'titles': raced}).fetchall())
+
+            return {title: self._ids[title] for title in companies if title in self._ids}
+
+
+company_cache = CompanyCache()
+
 
 class LoadPageViews:
-    def __init__(self, companies_pageviews, day, hour,):
+    def __init__(self, companies_pageviews=None, day=None, hour=None, year=2025, month=10):
         self.companies_pageviews = companies_pageviews
         self.day = day
         self.hour = hour
 
-        # # postgress DB connection details from .env
-        self.DB_HOST = "postgres"
-        self.DB_USER = "airflow"
-        self.DB_PASSWORD = "airflow"
-        self.DB_NAME = "wikipedia"
+        # Pageview dumps are stamped in UTC
+        self.hour_ts = (datetime(year, month, day, hour, tzinfo=timezone.utc)
+                        if day is not None and hour is not None else None)
+
+        self.engine = None
 
     def setup_database(self):
-        #create_database_sql = f""" CREATE DATABASE {self.DB_NAME} ; """
-
-        create_tables_sql = """
-        CREATE TABLE IF NOT EXISTS companies (
-            id SERIAL PRIMARY KEY,
-            company_name TEXT NOT NULL,
-            domain_code TEXT NOT NULL, 
-            page_title TEXT NOT NULL,
-            created_at TIMESTAMPTZ DEFAULT NOW(),
-            UNIQUE(page_title)
-        );
-
-        CREATE TABLE IF NOT EXISTS pageviews_hourly (
-            id SERIAL PRIMARY KEY,
-            company_id INTEGER NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
-            day INTEGER NOT NULL,
-            hour INTEGER NOT NULL,
-            view_count INTEGER NOT NULL,
-            response_size BIGINT NOT NULL,
-            created_at TIMESTAMPTZ DEFAULT NOW(),
-            UNIQUE(day, hour, company_id)
-        );
         """
-        engine_url = (f"postgresql+psycopg2://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}/{self.DB_NAME}")
-        if not engine_url:
-            raise ValueError("Could not build engine URL from Airflow connection 'my_postgres_db'.")
-        
-        #connect to default postgres db
-        self.engine = create_engine(engine_url)
-
-        #connect to the created db to set up the table
-        #self.engine = create_engine(f"postgresql+psycopg2://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}/{self.DB_NAME}")
-        with self.engine.begin() as conn:
-            conn.execute(text(create_tables_sql))
-            print("Table created successfully.")
+        Attach the shared pooled engine and make sure the schema is current.
+        """
+        self.engine = get_engine()
+        ensure_schema(self.engine)
+
+    @staticmethod
+    def _stage_rows(batch):
+        """
+        Turn (hour_ts, companies_pageviews) tuples into
+        (company_name, domain_code, page_title, hour_ts, views, resp_size)
+        rows, skipping companies with missing or malformed data.
+        """
+        for hour_ts, companies_pageviews in batch:
+            for company_name, data in companies_pageviews.items():
+                try:
+                    yield (company_name, data['domain_code'], data['page_title'],
+                           hour_ts, int(data['views']), int(data['resp_size']))
+                except (KeyError, ValueError, TypeError) as e:
+                    logging.warning(f"Skipping data for '{company_name}' at {hour_ts}: {e}")
+
+    def _copy_load(self, conn, batch):
+        """
+        Bulk load on an open connection in a fixed number of round trips:
+        resolve company IDs through the process-wide cache, COPY every row
+        into a temp staging table, then insert pageviews_hourly with one
+        set-based statement. Monthly partitions are created as needed.
+        Returns (rows staged, new pageview rows).
+        """
+        rows = list(self._stage_rows(batch))
+        if not rows:
+            return 0, 0
+
+        companies = {}
+        for company_name, domain_code, page_title, *_ in rows:
+            companies.setdefault(page_title, (company_name, domain_code))
+        company_ids = company_cache.resolve(conn, companies)
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        staged = 0
+        for _, _, page_title, hour_ts, view_count, response_size in rows:
+            company_id = company_ids.get(page_title)
+            if company_id is None:
+                logging.warning(f"Could not find or create a company ID for {page_title}. Skipping.")
+                continue
+            writer.writerow((company_id, hour_ts.isoformat(), view_count, response_size))
+            staged += 1
+
+        buffer.seek(0)
+
+        ensure_partitions(conn, {row[3] for row in rows})
+
+        conn.execute(text("""
+        CREATE TEMP TABLE pageviews_stage (
+            company_id INTEGER,
+            hour_ts TIMESTAMPTZ,
+            view_count INTEGER,
+            response_size BIGINT
+        ) ON COMMIT DROP;
+        """))
+
+        # Raw psycopg2 COPY under the SQLAlchemy connection: if the batch fails, its
+        # staged rows roll back with the companies and partitions created above
+        with conn.connection.cursor() as cursor:
+            cursor.copy_expert("COPY pageviews_stage FROM STDIN WITH (FORMAT csv)", buffer)
+
+        # One staged row per hour and company_id (company names sharing a page title
+        # share an ID); hours already in pageviews_hourly are left as loaded
+        result = conn.execute(text("""
+        INSERT INTO pageviews_hourly (company_id, hour_ts, view_count, response_size)
+        SELECT DISTINCT ON (hour_ts, company_id) company_id, hour_ts, view_count, response_size
+        FROM pageviews_stage
+        ORDER BY hour_ts, company_id
+        ON CONFLICT (hour_ts, company_id) DO NOTHING;
+        """))
+
+        return staged, result.rowcount
 
     def load_data(self):
-        logging.info(f"Starting data load for Oct {self.day}, {self.hour} pageviews")
-
-        upsert_company_sql = text("""
-        INSERT INTO companies (company_name, domain_code, page_title)
-        VALUES (:company_name, :domain_code, :page_title)
-        ON CONFLICT (page_title) DO NOTHING
-        RETURNING id;
-        """)
-
-        # Query to select the ID if the INSERT...ON CONFLICT did nothing
-        select_company_sql = text("SELECT id FROM companies WHERE page_title = :page_title;")
-        
-        # SQL to "upsert" the hourly data
-        insert_pageview_sql = text("""
-        INSERT INTO pageviews_hourly 
-            (company_id, day, hour, view_count, response_size)
-        VALUES (:company_id, :day, :hour, :view_count, :response_size)
-        ON CONFLICT (day, hour, company_id) DO NOTHING;
-        """)
-        
-        rows_added = 0
-        pageview_params_list = []
+        logging.info(f"Starting data load for {self.hour_ts:%Y-%m-%d %H}:00 UTC pageviews")
 
         try:
-            with self.engine.begin() as conn:
-                
-                # Upsert companies and get their IDs
-                for company_name, data in self.companies_pageviews.items():
-                    try:
-                        page_title = data['page_title'] # Get once
-                        
-                        company_params = {
-                            'company_name': company_name,
-                            'domain_code': data['domain_code'],
-                            'page_title': page_title
-                        }
-                        
-                        # Run the upsert and fetch the scalar result (the 'id' or None)
-                        result = conn.execute(upsert_company_sql, company_params).scalar()
-                        
-                        if result:
-                            # inserted a new company
-                            company_id = result
-                        else:
-                            # The company already existed, so the INSERT was
-                            # skipped. Select its ID.
-                            company_id = conn.execute(
-                                select_company_sql, 
-                                {'page_title': page_title}
-                            ).scalar()
-
-                        # This check is good practice, though it shouldn't fail
-                        # if the logic is sound.
-                        if company_id is None:
-                            logging.warning(f"Could not find or create a company ID for {page_title}. Skipping.")
-                            continue
-
-                        # Prepare the pageview data as a dict for bulk insert
-                        pageview_params = {
-                            'company_id': company_id,
-                            'day': self.day,
-                            'hour': self.hour,
-                            'view_count': int(data['views']),
-                            'response_size': int(data['resp_size'])
-                        }
-                        pageview_params_list.append(pageview_params)
-
-                    except (KeyError, ValueError, TypeError) as e:
-                        logging.warning(f"Skipping data for '{company_name}': {e}")
-                
-                # Bulk insert all pageview data ---
-                if not pageview_params_list:
-                    logging.warning("No valid pageview data to insert.")
-                else:
-                    # conn.execute with a list of dicts performs an "executemany"
-                    result_proxy = conn.execute(insert_pageview_sql, pageview_params_list)
-                    rows_added = result_proxy.rowcount
-                    logging.info(f"Processed {len(pageview_params_list)} company records.")
-                    
+            with StageMetrics("load", hour_ts=self.hour_ts) as stage, self.engine.begin() as conn:
+                staged, rows_added = self._copy_load(conn, [(self.hour_ts, self.companies_pageviews)])
+                stage.lines, stage.rows = staged, rows_added
+
                 # No explicit .commit() needed; the 'with engine.begin()' handles it.
-                logging.info(f"Data load complete. Added {rows_added} new pageview rows.")
+                if not staged:
+                    logging.warning("No valid pageview data to insert.")
+                logging.info(f"Data load complete. Processed {staged} company records, added {rows_added} new pageview rows.")
                 
-            
         except Exception as e:
             # No explicit .rollback() needed; 'with engine.begin()' handles it.
+            # IDs cached during the failed transaction may not exist, so drop them.
+            company_cache.invalidate()
+            forget_partitions()
             logging.error(f"Database error during data load: {e}")
             raise
 
+    def load_batch(self, batch):
+        """
+        Load many hours in a single transaction.
+        batch is a list of (hour_ts, companies_pageviews) tuples with
+        timezone-aware hour timestamps.
+        """
+        logging.info(f"Starting batch load of {len(batch)} hours")
+
+        try:
+            with StageMetrics("load", hours=len(batch)) as stage, self.engine.begin() as conn:
+                staged, rows_added = self._copy_load(conn, batch)
+                stage.lines, stage.rows = staged, rows_added
+
+            logging.info(f"Batch load complete. Processed {staged} records, added {rows_added} new pageview rows.")
+            return rows_added
+
+        except Exception as e:
+            company_cache.invalidate()
+            forget_partitions()
+            logging.error(f"Database error during batch load: {e}")
+            raise
+
 def load_task_callable(**context):
     """
     This is the function your PythonOperator will run.
@@ -147,11 +209,11 @@ def load_task_callable(**context):
     """
     logging.info("--- Starting Load Task (Normalized PostgreSQL) ---")
 
-    # Pull the pageviews dictionary from the 'extract' task
+    # Pull the pageviews dictionary from the 'extract' task's handoff file
     task_instance = context['task_instance']
-    extraction_results = task_instance.xcom_pull(task_ids='extract')
+    extraction_results = pull_results(task_instance, task_ids='extract')
     
-    if not extraction_results or not isinstance(extraction_results, dict):
+    if extraction_results is None or not isinstance(extraction_results, dict):
         raise ValueError("No results dictionary received from XCom. Upstream 'extract' may have failed.")
 
     logging.info(f"Received extraction dictionary for {list(extraction_results.keys())}")
@@ -169,6 +231,8 @@ def load_task_callable(**context):
         companies_pageviews=extraction_results,
         day=int(day),
         hour=int(hour),
+        year=int(params.get('year', 2025)),
+        month=int(params.get('month', 10)),
     )
     
     loader.setup_database()
@@ -0,0 +1,166 @@
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from scripts.download_pageviews import DownloadPageViews
+from scripts.extract_pageviews import ExtractPageViews
+from scripts.handoff import read_handoff, remove_handoffs, write_handoff
+from scripts.load_pageviews import LoadPageViews
+from scripts.sentiment_analysis import analyse_hours
+
+logging.basicConfig(level=logging.INFO)
+
+# Airflow refuses to expand a mapped task past this many instances
+MAX_MAPPED_HOURS = int(os.getenv("AIRFLOW__CORE__MAX_MAP_LENGTH", "1024"))
+
+
+def _as_utc(ts: datetime) -> datetime:
+    # Dumps are stamped in UTC; naive datetimes are taken to be UTC already
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts.astimezone(timezone.utc)
+
+
+class HourPlan:
+    """
+    The set of dump hours a mapped run fans out over: an explicit list of
+    hours, or every hour in [start, end).
+    """
+
+    def __init__(self, hours=None, start: datetime = None, end: datetime = None):
+        if hours:
+            self._hours = sorted({_as_utc(ts).replace(minute=0, second=0, microsecond=0) for ts in hours})
+        elif start is not None and end is not None:
+            start, end = _as_utc(start).replace(minute=0, second=0, microsecond=0), _as_utc(end)
+            if end <= start:
+                raise ValueError(f"End {end} must be after start {start}.")
+            self._hours = []
+            while start < end:
+                self._hours.append(start)
+                start += timedelta(hours=1)
+        else:
+            raise ValueError("HourPlan needs either hours or a start and end.")
+
+    @classmethod
+    def from_params(cls, params):
+        """
+        'hours' (ISO datetimes) wins over 'start'/'end'; a run with neither
+        falls back to the single year/month/day/hour of the hourly DAG.
+        """
+        if params.get("hours"):
+            return cls(hours=[datetime.fromisoformat(ts) for ts in params["hours"]])
+
+        if params.get("start") and params.get("end"):
+            return cls(start=datetime.fromisoformat(params["start"]), end=datetime.fromisoformat(params["end"]))
+
+        if params.get("day") is None or params.get("hour") is None:
+            raise ValueError("Set 'hours', 'start' and 'end', or 'day' and 'hour' in the DAG run configuration.")
+
+        return cls(hours=[datetime(int(params.get("year", 2025)), int(params.get("month", 10)),
+                                   int(params["day"]), int(params["hour"]))])
+
+    def hours(self):
+        return list(self._hours)
+
+    def expand_kwargs(self):
+        """
+        One op_kwargs dict per mapped task instance.
+        """
+        return [{"hour_ts": hour_ts.isoformat()} for hour_ts in self._hours]
+
+
+def plan_hours_callable(**context):
+    """
+    Airflow callable that turns the run's params into the list the
+    'download' task is expanded over.
+    """
+    plan = HourPlan.from_params(context["params"])
+    hours = plan.hours()
+
+    if len(hours) > MAX_MAPPED_HOURS:
+        raise ValueError(f"{len(hours)} hours exceed the {MAX_MAPPED_HOURS} mapped task limit. "
+                         "Split the range or raise AIRFLOW__CORE__MAX_MAP_LENGTH.")
+
+    logging.info(f"Fanning out {len(hours)} hours from {hours[0]} to {hours[-1]}")
+    return plan.expand_kwargs()
+
+
+def download_hour_callable(hour_ts, **context):
+    """
+    Mapped callable: fetch one hour's dump into the shared download cache.
+    An hour that cannot be fetched is passed on with gz_path None so the
+    rest of the run still loads.
+    """
+    ts = datetime.fromisoformat(hour_ts)
+    downloader = DownloadPageViews(day=ts.day, hour=ts.hour, year=ts.year, month=ts.month)
+    gz_path = downloader.fetch_gz()
+
+    return {"hour_ts": hour_ts, "gz_path": str(gz_path) if gz_path else None}
+
+
+def extract_hour_callable(hour_ts, gz_path, **context):
+    """
+    Mapped callable: filter one cached dump for the run's companies and hand
+    the rows off through the shared data volume.
+    An hour without rows returns a reference with handoff None: Airflow
+    pushes no XCom for None, so 'load' would not see the hour at all.
+    """
+    if gz_path is None:
+        logging.warning(f"No dump for {hour_ts}, skipping extraction.")
+        return {"handoff": None, "hour_ts": hour_ts}
+
+    companies = context["params"].get("companies")
+    extraction_results = ExtractPageViews(gz_path, companies).extract()
+
+    if extraction_results is None:
+        logging.warning(f"Could not extract {gz_path} for {hour_ts}, skipping.")
+        return {"handoff": None, "hour_ts": hour_ts}
+
+    ref = write_handoff(extraction_results, context)
+    ref["hour_ts"] = hour_ts
+    return ref
+
+
+def load_hours_callable(refs, **context):
+    """
+    Fan-in callable: load every extracted hour, batch_size hours per
+    transaction. Returns the loaded range for the 'analyse' task.
+    """
+    logging.info("--- Starting Mapped Load Task ---")
+
+    refs = sorted(refs, key=lambda ref: ref["hour_ts"])
+    found = [ref for ref in refs if ref["handoff"]]
+    missing = [ref["hour_ts"] for ref in refs if not ref["handoff"]]
+
+    if not found:
+        raise Exception("No hours were extracted; nothing to load.")
+
+    batch_size = int(context["params"].get("batch_size", 24))
+
+    loader = LoadPageViews()
+    loader.setup_database()
+
+    for i in range(0, len(found), batch_size):
+        batch = found[i:i + batch_size]
+        loader.load_batch([(_as_utc(datetime.fromisoformat(ref["hour_ts"])), read_handoff(ref))
+                           for ref in batch])
+
+    # 'load' is the only reader of these files; a retry of a failed load still has them
+    remove_handoffs(found)
+
+    if missing:
+        logging.warning(f"{len(missing)} hours could not be fetched: {missing}")
+
+    logging.info(f"✅ Loaded {len(found)} hours.")
+    return {"first_hour": found[0]["hour_ts"], "last_hour": found[-1]["hour_ts"],
+            "loaded": len(found), "missing": len(missing)}
+
+
+def analyse_hours_callable(summary, **context):
+    """
+    Fan-in callable: refresh rollups and signals once for everything the
+    'load' task wrote.
+    """
+    logging.info("--- Starting Sentiment Analysis Task ---")
+
+    analyse_hours(_as_utc(datetime.fromisoformat(summary["first_hour"])),
+                  _as_utc(datetime.fromisoformat(summary["last_hour"])),
+                  signal_window=int(context["params"].get("signal_window", 24)))
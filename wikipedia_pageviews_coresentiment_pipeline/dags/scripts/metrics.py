@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import socket
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from sqlalchemy import text
+
+from scripts.db import ensure_schema, get_engine
+
+logging.basicConfig(level=logging.INFO)
+
+# Set to 0 to only log metrics, e.g. when no database is reachable
+METRICS_TO_DB = os.getenv("WIKIPEDIA_METRICS_TO_DB", "1") not in ("0", "false", "False")
+
+# The last records of this process, for benchmarks and ad hoc inspection
+RECORDS = deque(maxlen=1000)
+
+_db_failed = False
+
+
+def peak_rss_kb():
+    """
+    High-water mark of resident memory for this process and its finished
+    children (e.g. extract pool workers), in KB. None where unsupported.
+    """
+    if resource is None:
+        return None
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def store_record(record):
+    """
+    Insert one metrics record into pipeline_metrics. Metrics must never fail
+    the pipeline: after the first database error this process only logs them.
+    """
+    global _db_failed
+
+    if not METRICS_TO_DB or _db_failed:
+        return
+
+    try:
+        engine = get_engine()
+        ensure_schema(engine)
+        with engine.begin() as conn:
+            conn.execute(text("""
+            INSERT INTO pipeline_metrics
+                (stage, hour_ts, started_at, wall_seconds, bytes, lines, rows, peak_rss_kb, status, host, pid, detail)
+            VALUES
+                (:stage, :hour_ts, :started_at, :wall_seconds, :bytes, :lines, :rows, :peak_rss_kb, :status, :host, :pid,
+                 CAST(:detail AS JSONB));
+            """), {**record, 'detail': json.dumps(record['detail'], default=str)})
+    except Exception as e:
+        _db_failed = True
+        logging.warning(f"Could not store pipeline metrics, logging only from now on: {e}")
+
+
+class StageMetrics:
+    """
+    Times one pipeline stage and records what it processed.
+
+        with StageMetrics("download", hour_ts=ts) as stage:
+            ...
+            stage.bytes += len(chunk)
+
+    On exit the stage's wall time, bytes/s, lines/s, rows and the process's
+    peak RSS are logged as one JSON line and stored in pipeline_metrics.
+    A stage that raises is recorded with status 'failed'; one that gives
+    up without raising can set stage.status itself.
+    """
+
+    def __init__(self, stage, hour_ts=None, **detail):
+        self.stage = stage
+        self.hour_ts = hour_ts
+        self.detail = detail
+        self.bytes = 0
+        self.lines = 0
+        self.rows = 0
+        self.status = "ok"
+        self.started_at = None
+        self.wall_seconds = None
+        self._start = None
+
+    def __enter__(self):
+        self.started_at = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.wall_seconds = time.perf_counter() - self._start
+
+        record = self.record(status="failed" if exc_type else self.status)
+        RECORDS.append(record)
+
+        rates = {key: record[key] / self.wall_seconds if record[key] and self.wall_seconds else None
+                 for key in ("bytes", "lines")}
+        logging.info("📊 " + json.dumps({
+            **{k: v for k, v in record.items() if k not in ("host", "pid")},
+            "bytes_per_sec": rates["bytes"],
+            "lines_per_sec": rates["lines"],
+        }, default=str))
+
+        store_record(record)
+        return False
+
+    def record(self, status):
+        return {
+            'stage': self.stage,
+            'hour_ts': self.hour_ts,
+            'started_at': self.started_at,
+            'wall_seconds': self.wall_seconds,
+            'bytes': self.bytes,
+            'lines': self.lines,
+            'rows': self.rows,
+            'peak_rss_kb': peak_rss_kb(),
+            'status': status,
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'detail': self.detail,
+        }
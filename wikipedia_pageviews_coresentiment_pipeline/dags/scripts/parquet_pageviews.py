@@ -0,0 +1,139 @@
+import logging
+from datetime import date
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from scripts.config import DATA_DIR
+
+logging.basicConfig(level=logging.INFO)
+
+PARQUET_ROOT = DATA_DIR / "parquet" / "pageviews"
+
+# Column types of the dataset; day and hour come from the directory partitions
+SCHEMA = pa.schema([
+    ("domain_code", pa.string()),
+    ("page_title", pa.string()),
+    ("company_name", pa.string()),
+    ("views", pa.int64()),
+    ("resp_size", pa.int64()),
+])
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("day", pa.date32()), ("hour", pa.int8())]),
+    flavor="hive",
+)
+
+
+class ParquetPageViews:
+    """
+    Writes extracted pageviews for one hour into a hive-partitioned
+    Parquet dataset (day=YYYY-MM-DD/hour=H/) and reads ranges of it back.
+    """
+
+    def __init__(self, root=PARQUET_ROOT):
+        self.root = Path(root)
+
+    @staticmethod
+    def company_rows(companies_pageviews):
+        """
+        Flatten ExtractPageViews results into rows, skipping companies with no match.
+        """
+        for company_name, data in companies_pageviews.items():
+            if not data:
+                continue
+            yield {'domain_code': data['domain_code'],
+                   'page_title': data['page_title'],
+                   'company_name': company_name,
+                   'views': int(data['views']),
+                   'resp_size': int(data['resp_size'])}
+
+    @staticmethod
+    def watchlist_rows(watchlist_pageviews):
+        """
+        Flatten ExtractWatchlistPageViews aggregates into rows.
+        """
+        for page_title, domains in watchlist_pageviews.items():
+            for domain_code, counts in domains.items():
+                yield {'domain_code': domain_code,
+                       'page_title': page_title,
+                       'company_name': None,
+                       'views': counts['views'],
+                       'resp_size': counts['resp_size']}
+
+    @classmethod
+    def result_rows(cls, extraction_results):
+        """
+        Flatten either kind of extract result. Returns (kind, rows) where kind
+        is 'companies' or 'watchlist'.
+        Watchlist results are keyed by title and nest one level per domain.
+        """
+        is_watchlist = any(isinstance(v, dict) and 'views' not in v for v in extraction_results.values())
+        if is_watchlist:
+            return 'watchlist', cls.watchlist_rows(extraction_results)
+        return 'companies', cls.company_rows(extraction_results)
+
+    def hour_path(self, day: date, hour: int) -> Path:
+        return self.root / f"day={day.isoformat()}" / f"hour={hour}"
+
+    def write_hour(self, rows, day: date, hour: int) -> Path:
+        """
+        Replace the partition for one hour with the given rows.
+        Rewriting a whole partition keeps re-runs idempotent.
+        """
+        table = pa.Table.from_pylist(list(rows), schema=SCHEMA)
+
+        hour_dir = self.hour_path(day, hour)
+        hour_dir.mkdir(parents=True, exist_ok=True)
+        out_path = hour_dir / "part-0.parquet"
+
+        pq.write_table(table, out_path, compression="zstd")
+        logging.info(f"✅ Wrote {table.num_rows} rows to {out_path}")
+        return out_path
+
+    def read(self, start: date, end: date, columns=None, filter_expression=None):
+        """
+        Read days in [start, end] as an Arrow table.
+        Partitions outside the range are pruned from the directory names and
+        only the requested columns are decoded.
+        """
+        dataset = ds.dataset(self.root, format="parquet", partitioning=PARTITIONING)
+
+        expression = (ds.field("day") >= pa.scalar(start, pa.date32())) & \
+                     (ds.field("day") <= pa.scalar(end, pa.date32()))
+        if filter_expression is not None:
+            expression = expression & filter_expression
+
+        return dataset.to_table(columns=columns, filter=expression)
+
+
+def write_parquet_task_callable(**context):
+    """
+    Airflow callable that writes the 'extract' results for the run's hour
+    to the Parquet dataset. Works with both the company and watchlist extracts.
+    """
+    logging.info("--- Starting Parquet Write Task ---")
+
+    params = context["params"]
+    if not params.get("parquet_output", True):
+        logging.info("parquet_output is off, skipping.")
+        return None
+
+    from scripts.handoff import pull_results
+
+    task_instance = context['task_instance']
+    extraction_results = pull_results(task_instance, task_ids='extract')
+
+    if extraction_results is None:
+        raise ValueError("No results received from XCom. Upstream 'extract' may have failed.")
+
+    day = date(int(params.get("year", 2025)), int(params.get("month", 10)), int(params["day"]))
+    hour = int(params["hour"])
+
+    writer = ParquetPageViews(params.get("parquet_root", PARQUET_ROOT))
+
+    _, rows = writer.result_rows(extraction_results)
+
+    return str(writer.write_hour(rows, day, hour))
@@ -1,42 +1,34 @@
-from dotenv import load_dotenv
-import os
-from sqlalchemy import create_engine, text
+from datetime import date, datetime, time, timedelta, timezone
+from sqlalchemy import text
 import logging
 
-# # postgress DB connection details from .env
-DB_HOST = "postgres"
-DB_USER = "airflow"
-DB_PASSWORD = "airflow"
-DB_NAME = "wikipedia"
+from scripts.db import ensure_schema, get_engine
+from scripts.metrics import StageMetrics
+from scripts.sentiment_signals import SentimentSignals
 
-def companies_by_top_views(day, hour):
+def companies_by_top_views(day, hour, year=2025, month=10):
 
     sql = text(""" SELECT "companies"."company_name", "pageviews_hourly"."view_count" 
                FROM "companies" JOIN "pageviews_hourly" ON "pageviews_hourly"."company_id" = "companies"."id" 
-               WHERE "pageviews_hourly"."day" = 22 
-                AND "pageviews_hourly"."hour" = 10 
+               WHERE "pageviews_hourly"."hour_ts" = :hour_ts
                ORDER BY "pageviews_hourly"."view_count" DESC;
             """)
     
     params= {
-        "day_value": day,
-        "hour_value": hour
+        "hour_ts": datetime(year, month, day, hour, tzinfo=timezone.utc)
         }
     
     try:
-        engine_url = (f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}")
-        if not engine_url:
-            raise ValueError("Could not build engine URL from Airflow connection 'my_postgres_db'.")
-        
-        #connect to default postgres db
-        engine = create_engine(engine_url)
+        engine = get_engine()
     
-        with engine.connect() as conn:
+        with StageMetrics("query", hour_ts=params["hour_ts"], query="companies_by_top_views") as stage, \
+                engine.connect() as conn:
             # Pass the params_dict as the second argument to execute()
             result = conn.execute(sql, params)
             
             # Get all rows from the result
             rows = result.fetchall()
+            stage.rows = len(rows)
             
             if not rows:
                 logging.info(f"No data found for day={day}, hour={hour}.")
@@ -50,16 +42,156 @@ def companies_by_top_views(day, hour):
         logging.error(f"An error occurred: {e}")
 
 
+def refresh_rollups(first_hour: datetime, last_hour: datetime):
+    """
+    Recompute pageviews_daily and pageviews_weekly for the UTC days and
+    weeks touched by the hours in [first_hour, last_hour], and nothing else.
+    """
+    first_day = first_hour.astimezone(timezone.utc).date()
+    last_day = last_hour.astimezone(timezone.utc).date()
+    first_week = first_day - timedelta(days=first_day.weekday())
+    last_week = last_day - timedelta(days=last_day.weekday())
+
+    # Bind aware bounds so the session time zone cannot shift the day boundaries
+    first_ts = datetime.combine(first_day, time(), timezone.utc)
+    end_ts = datetime.combine(last_day + timedelta(days=1), time(), timezone.utc)
+
+    refresh_daily_sql = text("""
+    INSERT INTO pageviews_daily (company_id, day, view_count, hours_loaded)
+    SELECT company_id, (hour_ts AT TIME ZONE 'UTC')::date, SUM(view_count), COUNT(*)
+    FROM pageviews_hourly
+    WHERE hour_ts >= :first_ts AND hour_ts < :end_ts
+    GROUP BY 1, 2
+    ON CONFLICT (day, company_id) DO UPDATE
+        SET view_count = EXCLUDED.view_count,
+            hours_loaded = EXCLUDED.hours_loaded,
+            updated_at = NOW();
+    """)
+
+    refresh_weekly_sql = text("""
+    INSERT INTO pageviews_weekly (company_id, week_start, view_count, hours_loaded)
+    SELECT company_id, date_trunc('week', day)::date, SUM(view_count), SUM(hours_loaded)
+    FROM pageviews_daily
+    WHERE day >= :first_week AND day < CAST(:last_week AS DATE) + 7
+    GROUP BY 1, 2
+    ON CONFLICT (week_start, company_id) DO UPDATE
+        SET view_count = EXCLUDED.view_count,
+            hours_loaded = EXCLUDED.hours_loaded,
+            updated_at = NOW();
+    """)
+
+    engine = get_engine()
+    ensure_schema(engine)
+
+    with StageMetrics("rollups", first_day=first_day, last_day=last_day) as stage, engine.begin() as conn:
+        stage.rows += conn.execute(refresh_daily_sql, {"first_ts": first_ts, "end_ts": end_ts}).rowcount
+        stage.rows += conn.execute(refresh_weekly_sql, {"first_week": first_week, "last_week": last_week}).rowcount
+
+    logging.info(f"Refreshed rollups for {first_day} to {last_day}")
+
+
+def top_companies(start: date, end: date, limit=10):
+    """
+    Companies with the most views over the days in [start, end), with
+    their share of all tracked views in the window.
+    """
+    sql = text("""
+    SELECT c.company_name,
+           SUM(d.view_count) AS view_count,
+           SUM(d.view_count)::float / NULLIF(SUM(SUM(d.view_count)) OVER (), 0) AS view_share
+    FROM pageviews_daily d
+    JOIN companies c ON c.id = d.company_id
+    WHERE d.day >= :start AND d.day < :end
+    GROUP BY c.company_name
+    ORDER BY view_count DESC
+    LIMIT :limit;
+    """)
+
+    with get_engine().connect() as conn:
+        return conn.execute(sql, {"start": start, "end": end, "limit": limit}).fetchall()
+
+
+def views_trend(start: date, end: date, granularity="day"):
+    """
+    Per-company view totals per day or per week over [start, end).
+    """
+    if granularity == "week":
+        sql = text("""
+        SELECT c.company_name, w.week_start AS period, w.view_count
+        FROM pageviews_weekly w
+        JOIN companies c ON c.id = w.company_id
+        WHERE w.week_start >= :start AND w.week_start < :end
+        ORDER BY c.company_name, period;
+        """)
+    else:
+        sql = text("""
+        SELECT c.company_name, d.day AS period, d.view_count
+        FROM pageviews_daily d
+        JOIN companies c ON c.id = d.company_id
+        WHERE d.day >= :start AND d.day < :end
+        ORDER BY c.company_name, period;
+        """)
+
+    with get_engine().connect() as conn:
+        return conn.execute(sql, {"start": start, "end": end}).fetchall()
+
+
+def share_of_views(start: date, end: date, granularity="day"):
+    """
+    Each company's share of all tracked views, per day or per week.
+    """
+    table, period = ("pageviews_weekly", "week_start") if granularity == "week" else ("pageviews_daily", "day")
+
+    sql = text(f"""
+    SELECT c.company_name, r.{period} AS period,
+           r.view_count::float / NULLIF(SUM(r.view_count) OVER (PARTITION BY r.{period}), 0) AS view_share
+    FROM {table} r
+    JOIN companies c ON c.id = r.company_id
+    WHERE r.{period} >= :start AND r.{period} < :end
+    ORDER BY period, view_share DESC;
+    """)
+
+    with get_engine().connect() as conn:
+        return conn.execute(sql, {"start": start, "end": end}).fetchall()
+
+
 def analysis_callable(**context):
     logging.info("--- Starting Sentiment Analysis Task ---")
-    #Get day/hour from params to tag the data
     params = context.get('params', {})
+
+    # Ranges of hours are analysed by the mapped DAGs' analyse_hours_callable
     day = params.get('day')
     hour = params.get('hour')
 
     if day is None or hour is None:
         raise ValueError("'day' or 'hour' not found in DAG params.")
-    
+
+    hour_ts = datetime(int(params.get('year', 2025)), int(params.get('month', 10)),
+                       int(day), int(hour), tzinfo=timezone.utc)
+
     #run analysis
-    companies_by_top_views(day=day, hour=hour)
-    logging.info("Sentiment Analysis Query ran successfully.")
\ No newline at end of file
+    companies_by_top_views(day=hour_ts.day, hour=hour_ts.hour, year=hour_ts.year, month=hour_ts.month)
+
+    analyse_hours(hour_ts, hour_ts, signal_window=int(params.get('signal_window', 24)))
+
+
+def analyse_hours(first_hour: datetime, last_hour: datetime, signal_window=24):
+    """
+    Post-load analysis for the hours in [first_hour, last_hour]: refresh
+    the rollups and signals they touch and log the trailing week's ranking.
+    """
+    # Only the days and weeks these hours fall in are recomputed
+    refresh_rollups(first_hour, last_hour)
+
+    SentimentSignals(first_hour, last_hour + timedelta(hours=1), window=signal_window).run()
+
+    week_start = last_hour.date() - timedelta(days=6)
+    with StageMetrics("query", query="top_companies") as stage:
+        ranking = top_companies(week_start, last_hour.date() + timedelta(days=1))
+        stage.rows = len(ranking)
+
+    logging.info(f"Top companies for the 7 days to {last_hour.date()}:")
+    for row in ranking:
+        logging.info(f"  Company: {row.company_name}, Views: {row.view_count}, Share: {row.view_share:.1%}")
+
+    logging.info("Sentiment Analysis Query ran successfully.")
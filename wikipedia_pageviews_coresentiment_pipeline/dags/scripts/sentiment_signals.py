@@ -0,0 +1,199 @@
+import io
+import logging
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from sqlalchemy import text
+
+from scripts.db import ensure_schema, get_engine
+from scripts.metrics import StageMetrics
+
+logging.basicConfig(level=logging.INFO)
+
+SIGNAL_COLUMNS = ["company_id", "hour_ts", "view_count", "view_delta", "pct_change", "zscore", "attention_share"]
+
+
+class SentimentSignals:
+    """
+    Computes per company, per hour attention signals over [start, end):
+    hour-over-hour view deltas, a z-score of each hour against the trailing
+    `window` hours, and the company's share of all tracked views that hour.
+    The pageviews are pulled as one hour x company matrix and every signal
+    is a whole-matrix pandas/NumPy operation; results are upserted into
+    company_sentiment_signals.
+    """
+
+    def __init__(self, start: datetime, end: datetime, window=24, min_periods=6):
+        # Hours are aligned to UTC, as pageviews_hourly stores them
+        start, end = (ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts.astimezone(timezone.utc)
+                      for ts in (start, end))
+
+        self.start = start.replace(minute=0, second=0, microsecond=0)
+        self.end = end
+        if self.end <= self.start:
+            raise ValueError(f"Signal window end {end} must be after start {start}.")
+
+        self.window = window
+        self.min_periods = min(min_periods, window)
+
+        self.engine = None
+
+    @property
+    def lookback_start(self):
+        """
+        First hour read from the database: the z-scores and deltas at
+        `start` need the `window` hours before it.
+        """
+        return self.start - timedelta(hours=self.window)
+
+    def fetch_matrix(self, conn) -> pd.DataFrame:
+        """
+        Hour x company_id matrix of view counts in one query.
+        A company with no row in a loaded hour had no views and gets 0; hours
+        with no rows at all were never loaded and stay NaN so they do not
+        pass for a collapse in attention.
+        """
+        buffer = io.StringIO()
+
+        # COPY out with epoch seconds, so no per-row datetime objects are built
+        with conn.connection.cursor() as cursor:
+            cursor.copy_expert(cursor.mogrify("""
+            COPY (SELECT EXTRACT(EPOCH FROM hour_ts)::BIGINT, company_id, view_count
+                  FROM pageviews_hourly
+                  WHERE hour_ts >= %(start)s AND hour_ts < %(end)s) TO STDOUT WITH (FORMAT csv)
+            """, {"start": self.lookback_start, "end": self.end}).decode(), buffer)
+
+        buffer.seek(0)
+
+        hours = pd.date_range(self.lookback_start, self.end, freq="h", inclusive="left")
+
+        if not buffer.getvalue():
+            return pd.DataFrame(index=hours, dtype="float64")
+
+        frame = pd.read_csv(buffer, names=["epoch", "company_id", "view_count"], dtype="int64")
+        frame["hour_ts"] = pd.to_datetime(frame["epoch"], unit="s", utc=True)
+        matrix = frame.pivot(index="hour_ts", columns="company_id", values="view_count")
+
+        return matrix.fillna(0).astype("float64").reindex(hours)
+
+    def compute(self, matrix: pd.DataFrame) -> pd.DataFrame:
+        """
+        Signals for every (hour, company) cell in [start, end), as one long
+        frame with SIGNAL_COLUMNS.
+        """
+        # No company has pageviews in the window yet
+        if matrix.columns.empty:
+            return pd.DataFrame(columns=SIGNAL_COLUMNS)
+
+        previous = matrix.shift(1)
+        delta = matrix - previous
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pct_change = delta / previous
+
+        # Score each hour against the window before it, not including itself
+        rolling = matrix.rolling(self.window, min_periods=self.min_periods)
+        mean = rolling.mean().shift(1)
+        std = rolling.std().shift(1)
+        zscore = (matrix - mean) / std.where(std > 0)
+
+        totals = matrix.sum(axis=1, min_count=1)
+        attention_share = matrix.div(totals.where(totals > 0), axis=0)
+
+        signals = pd.concat({
+            "view_count": matrix,
+            "view_delta": delta,
+            "pct_change": pct_change.replace([np.inf, -np.inf], np.nan),
+            "zscore": zscore,
+            "attention_share": attention_share,
+        }, axis=1)
+
+        signals = signals.loc[signals.index >= self.start]
+        signals.index.name = "hour_ts"
+        signals.columns.names = ["signal", "company_id"]
+
+        long = signals.stack("company_id", future_stack=True).reset_index()
+        long = long[long["view_count"].notna()]
+
+        long["company_id"] = long["company_id"].astype("int64")
+        long["view_count"] = long["view_count"].astype("int64")
+        long["view_delta"] = long["view_delta"].round().astype("Int64")
+
+        return long[SIGNAL_COLUMNS]
+
+    @staticmethod
+    def write(conn, signals: pd.DataFrame) -> int:
+        """
+        COPY the signals into a temp staging table and upsert them with one
+        statement, so recomputing a range replaces the earlier values.
+        """
+        if signals.empty:
+            return 0
+
+        # Stage hour_ts as epoch seconds and format the CSV with Arrow's
+        # writer: DataFrame.to_csv is several times slower on millions of rows
+        epoch = (signals["hour_ts"] - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)
+        staged = pa.Table.from_pandas(signals.assign(hour_ts=epoch), preserve_index=False)
+
+        sink = pa.BufferOutputStream()
+        pacsv.write_csv(staged, sink, pacsv.WriteOptions(include_header=False))
+        buffer = pa.BufferReader(sink.getvalue())
+
+        conn.execute(text("""
+        CREATE TEMP TABLE company_sentiment_signals_stage (
+            company_id INTEGER,
+            epoch BIGINT,
+            view_count BIGINT,
+            view_delta BIGINT,
+            pct_change DOUBLE PRECISION,
+            zscore DOUBLE PRECISION,
+            attention_share DOUBLE PRECISION
+        ) ON COMMIT DROP;
+        """))
+
+        with conn.connection.cursor() as cursor:
+            cursor.copy_expert("COPY company_sentiment_signals_stage FROM STDIN WITH (FORMAT csv)", buffer)
+
+        result = conn.execute(text("""
+        INSERT INTO company_sentiment_signals
+            (company_id, hour_ts, view_count, view_delta, pct_change, zscore, attention_share)
+        SELECT company_id, to_timestamp(epoch), view_count, view_delta, pct_change, zscore, attention_share
+        FROM company_sentiment_signals_stage
+        ON CONFLICT (hour_ts, company_id) DO UPDATE
+            SET view_count = EXCLUDED.view_count,
+                view_delta = EXCLUDED.view_delta,
+                pct_change = EXCLUDED.pct_change,
+                zscore = EXCLUDED.zscore,
+                attention_share = EXCLUDED.attention_share,
+                computed_at = NOW()
+            -- rows whose signals did not change are left alone
+            WHERE (company_sentiment_signals.view_count, company_sentiment_signals.view_delta,
+                   company_sentiment_signals.pct_change, company_sentiment_signals.zscore,
+                   company_sentiment_signals.attention_share)
+                  IS DISTINCT FROM
+                  (EXCLUDED.view_count, EXCLUDED.view_delta, EXCLUDED.pct_change,
+                   EXCLUDED.zscore, EXCLUDED.attention_share);
+        """))
+
+        return result.rowcount
+
+    def run(self) -> int:
+        """
+        Returns the number of signal rows inserted or changed.
+        """
+        self.engine = get_engine()
+        ensure_schema(self.engine)
+
+        with StageMetrics("signals", start=self.start, end=self.end) as stage, self.engine.begin() as conn:
+            matrix = self.fetch_matrix(conn)
+            signals = self.compute(matrix)
+            written = self.write(conn, signals)
+            stage.lines, stage.rows = len(signals), written
+            stage.detail['companies'] = matrix.shape[1]
+
+        logging.info(f"✅ Upserted {written} changed sentiment signal rows for {matrix.shape[1]} companies "
+                     f"from {self.start:%Y-%m-%d %H}:00 to {self.end:%Y-%m-%d %H}:00 UTC")
+        return written
@@ -0,0 +1,73 @@
+import logging
+import requests
+
+from scripts.download_pageviews import DownloadPageViews, BASE_URL
+from scripts.extract_pageviews import ExtractPageViews
+from scripts.handoff import write_handoff
+
+logging.basicConfig(level=logging.INFO)
+
+
+class StreamPageViews:
+    """
+    Downloads and filters a pageview dump in a single pass.
+    Lines are parsed as the HTTP chunks arrive, so extraction overlaps
+    with the download instead of waiting for the whole file.
+    """
+
+    def __init__(self, day, hour, companies: dict, year=2025, month=10, base_url=BASE_URL):
+        self.downloader = DownloadPageViews(day=day, hour=hour, year=year, month=month, base_url=base_url)
+        self.extractor = ExtractPageViews(extracted_path=None, companies=companies)
+
+    def run(self):
+        """
+        Returns the matching company rows, or None if the dump could not be fetched.
+        """
+        try:
+            results = self.extractor.extract_lines(self.downloader.iter_lines())
+
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                logging.error(f"Pageview file not available yet for {self.downloader.pageview_filename}. "
+                              "Try again later.")
+            else:
+                logging.error(f"❌ HTTP error while streaming file: {e}")
+            return None
+
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Network error while streaming file: {e}")
+            return None
+
+        logging.info("✅ Extracted pageviews from stream")
+        return results
+
+
+def stream_extract_task_callable(**context):
+    """
+    Airflow callable that replaces the separate 'download' and 'extract' tasks.
+    Pulls day, hour and companies from params and hands the results off to
+    the 'load' task through an Arrow file.
+    """
+    logging.info("--- Starting Streaming Download + Extract Task ---")
+
+    params = context["params"]
+    day = params.get("day")
+    hour = params.get("hour")
+    year = int(params.get("year", 2025))
+    month = int(params.get("month", 10))
+    companies_dict = params.get("companies")
+
+    if day is None or hour is None:
+        raise ValueError("Missing 'day' or 'hour' in DAG run configuration.")
+
+    logging.info(f"Filtering for companies: {list(companies_dict.keys())}")
+
+    streamer = StreamPageViews(day=int(day), hour=int(hour), companies=companies_dict,
+                               year=year, month=month)
+    extraction_results = streamer.run()
+
+    if extraction_results is None:
+        raise Exception("Streaming download failed.")
+
+    logging.info("✅ Extraction successful. Handing results off to the 'load' task.")
+    return write_handoff(extraction_results, context)
@@ -0,0 +1,9 @@
+import os
+import sys
+from pathlib import Path
+
+# The DAG scripts are imported as scripts.*, from dags/, as Airflow does
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "dags"))
+
+# Keep stage metrics in the logs instead of the database
+os.environ.setdefault("WIKIPEDIA_METRICS_TO_DB", "0")
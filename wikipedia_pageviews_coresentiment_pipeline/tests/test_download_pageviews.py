@@ -0,0 +1,152 @@
+import gzip
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from scripts.download_pageviews import DownloadPageViews
+
+DUMP_PATH = "/2025/2025-10/pageviews-20251022-100000.gz"
+DUMP = gzip.compress(b"".join(b"en Page_%d %d 0\n" % (i, i) for i in range(20000)))
+
+
+class DumpHandler(BaseHTTPRequestHandler):
+    """
+    Serves one dump with Range support, like dumps.wikimedia.org, plus the
+    month's md5sums.txt. Every request is recorded on the server.
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.headers.get("Range")))
+
+        if self.path == "/2025/2025-10/md5sums.txt":
+            body = f"{server.md5}  pageviews-20251022-100000.gz\n".encode()
+            return self._send(200, body)
+
+        if self.path != DUMP_PATH:
+            return self._send(404, b"")
+
+        byte_range = self.headers.get("Range")
+        if byte_range is None or server.ignore_range:
+            return self._send(200, DUMP)
+
+        start = int(byte_range.removeprefix("bytes=").rstrip("-"))
+        if start >= len(DUMP):
+            return self._send(416, b"")
+        self._send(206, DUMP[start:], {"Content-Range": f"bytes {start}-{len(DUMP) - 1}/{len(DUMP)}"})
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), DumpHandler)
+    server.requests = []
+    server.md5 = hashlib.md5(DUMP).hexdigest()
+    server.ignore_range = False
+
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def downloader(server, tmp_path):
+    return DownloadPageViews(day=22, hour=10, base_url=f"http://127.0.0.1:{server.server_port}/",
+                             data_dir=tmp_path)
+
+
+def dump_requests(server):
+    return [byte_range for path, byte_range in server.requests if path == DUMP_PATH]
+
+
+def test_fresh_download_is_verified_and_cached(server, downloader):
+    path = downloader.fetch_gz()
+
+    assert path.read_bytes() == DUMP
+    assert dump_requests(server) == [None]
+    assert not path.with_name(path.name + ".part").exists()
+    assert path.with_name(path.name + ".md5").read_text().split()[:2] == [server.md5, str(len(DUMP))]
+
+
+def test_cache_hit_makes_no_requests(server, downloader):
+    downloader.fetch_gz()
+    server.requests.clear()
+
+    assert downloader.fetch_gz().read_bytes() == DUMP
+    assert server.requests == []
+
+
+def test_partial_download_is_resumed(server, downloader):
+    partial = downloader.download_dir / "pageviews-20251022-100000.gz.part"
+    partial.write_bytes(DUMP[:1000])
+
+    path = downloader.fetch_gz()
+
+    assert path.read_bytes() == DUMP
+    assert dump_requests(server) == ["bytes=1000-"]
+
+
+def test_complete_partial_download_answered_with_416(server, downloader):
+    partial = downloader.download_dir / "pageviews-20251022-100000.gz.part"
+    partial.write_bytes(DUMP)
+
+    path = downloader.fetch_gz()
+
+    assert path.read_bytes() == DUMP
+    assert dump_requests(server) == [f"bytes={len(DUMP)}-"]
+
+
+def test_server_ignoring_range_restarts_the_download(server, downloader):
+    server.ignore_range = True
+    partial = downloader.download_dir / "pageviews-20251022-100000.gz.part"
+    partial.write_bytes(b"stale bytes")
+
+    assert downloader.fetch_gz().read_bytes() == DUMP
+
+
+def test_checksum_mismatch_discards_the_download(server, downloader):
+    server.md5 = "0" * 32
+
+    assert downloader.fetch_gz() is None
+    assert list(downloader.download_dir.glob("*.gz*")) == [downloader.download_dir /
+                                                          "pageviews-20251022-100000.gz.lock"]
+
+    # The next attempt starts over instead of resuming the rejected bytes
+    server.md5 = hashlib.md5(DUMP).hexdigest()
+    server.requests.clear()
+    assert downloader.fetch_gz().read_bytes() == DUMP
+    assert dump_requests(server) == [None]
+
+
+def test_corrupt_cached_dump_is_downloaded_again(server, downloader):
+    path = downloader.fetch_gz()
+    stat = path.stat()
+    path.write_bytes(DUMP[:100] + bytes([DUMP[100] ^ 0xFF]) + DUMP[101:])
+    # Same size; a later mtime marks the file as changed since it was verified
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    server.requests.clear()
+
+    assert downloader.fetch_gz().read_bytes() == DUMP
+    assert dump_requests(server) == [None]
+
+
+def test_missing_dump_returns_none(server, tmp_path):
+    downloader = DownloadPageViews(day=23, hour=10, base_url=f"http://127.0.0.1:{server.server_port}/",
+                                   data_dir=tmp_path)
+
+    assert downloader.fetch_gz() is None